@@ -5,10 +5,17 @@
 import asyncio
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from faststream.nats import NatsBroker
 from pac0.service.api_gateway.lib import trace
-from pac0.service.api_gateway.lib.common import broker, global_state
+from pac0.service.api_gateway.lib.common import (
+    broker,
+    flow_store,
+    global_state,
+    intake_allowed,
+)
+from pac0.shared.flowstore import FlowState, FlowStore
+from pac0.shared.priority import Priority
 
 router = APIRouter()
 
@@ -18,14 +25,36 @@ async def read_root():
     return {"Hello": "World"}
 
 
-@router.post("/flows")
-async def flows_post():
-    return {"Hello": "World"}
+@router.post("/flows", dependencies=[Depends(intake_allowed)])
+async def flows_post(priority: Priority = Priority.HIGH):
+    # interactive deposits: high priority, bulk (e-reporting): low
+    return {"Hello": "World", "priority": priority}
+
+
+@router.get("/flows")
+async def flows_search(
+    store: Annotated[FlowStore, Depends(flow_store)],
+    tracking_id: Annotated[str | None, Query(alias="trackingId")] = None,
+    siren: str | None = None,
+) -> list[FlowState]:
+    """flows by tracking id or SIREN (index lookups)"""
+    if tracking_id is not None:
+        state = await store.by_tracking_id(tracking_id)
+        return [state] if state is not None else []
+    if siren is not None:
+        return await store.by_siren(siren)
+    raise HTTPException(status_code=400, detail="trackingId or siren required")
 
 
 @router.get("/flows/{flowId}")
-async def flows_get():
-    return {"Hello": "World"}
+async def flows_get(
+    flowId: str,
+    store: Annotated[FlowStore, Depends(flow_store)],
+) -> FlowState:
+    state = await store.get(flowId)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"unknown flow {flowId}")
+    return state
 
 
 @router.get("/healthcheck")
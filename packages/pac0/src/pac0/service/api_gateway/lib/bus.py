@@ -7,10 +7,14 @@ from typing import Any
 from fastapi import FastAPI
 from faststream.nats.fastapi import NatsMessage, NatsRouter
 from pac0.service.api_gateway.lib import trace
-from pac0.service.api_gateway.lib.common import global_state
-from pac0.shared.esb import get_nats_url
+from pac0.service.api_gateway.lib.common import global_state, load_monitor
+from pac0.shared.backpressure import LOAD_SUBJECT
+from pac0.shared.esb import NatsPool, SettingsService, get_nats_url, nats_pool
 
-router = NatsRouter(get_nats_url())
+router = NatsRouter(
+    get_nats_url(), **NatsPool.connection_kwargs(SettingsService())
+)
+nats_pool.register("api-gateway", router.broker)
 
 
 @router.after_startup
@@ -83,3 +87,8 @@ async def healthcheck_resp_sub(
 ):
     # logger.info("Incoming value: %s, depends value: %s" % (message.m, dependency))
     global_state["healthcheck_resp"].append("xx")
+
+
+@router.subscriber(LOAD_SUBJECT)
+async def load_sub(stats: dict[str, Any]):
+    load_monitor.update(stats)
@@ -3,7 +3,10 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from typing import Any
-from fastapi import Request
+from fastapi import HTTPException, Request
+
+from pac0.shared.backpressure import LoadMonitor
+from pac0.shared.esb import SettingsService
 
 
 def broker(
@@ -13,8 +16,28 @@ def broker(
     return request.app.state.broker
 
 
+def flow_store(
+    request: Request,
+):
+    """dependency shortcut to access the flow lifecycle store"""
+    return request.app.state.flow_store
+
+
 # global state from api router or broker router"""
 global_state: dict[str, Any] = {
     'healthcheck_resp': [],
 }
 
+# load of the pipeline stages, fed by the load reports (see bus.py)
+load_monitor = LoadMonitor.from_settings(SettingsService())
+
+
+def intake_allowed():
+    """dependency: refuse new flows while the pipeline is saturated"""
+    saturated = load_monitor.saturated()
+    if saturated:
+        raise HTTPException(
+            status_code=503,
+            detail=f"pipeline saturated: {', '.join(saturated)}",
+            headers={"Retry-After": str(load_monitor.retry_after())},
+        )
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""api gateway subscribers on the in-memory bus (monolith runtime, see bus.py)"""
+
+from pac0.service.api_gateway.lib import trace
+from pac0.service.api_gateway.lib.common import global_state, load_monitor
+from pac0.shared.backpressure import LOAD_SUBJECT
+from pac0.shared.membus import bus, current_message
+
+
+if trace.TESTING:
+
+    @bus.subscriber("*")
+    async def all_sub(body):
+        msg = current_message.get()
+        trace.add(
+            trace.MsgInfo(
+                body=body if isinstance(body, bytes) else str(body).encode(),
+                content_type="",
+                message_id=msg.correlation_id,
+                correlation_id=msg.correlation_id,
+                path={},
+                committed=None,
+                subject=msg.subject,
+                reply="",
+            )
+        )
+
+
+@bus.subscriber("healthcheck")
+async def healthcheck_sub(body):
+    await bus.publish("I am alive !", "healthcheck_resp")
+
+
+@bus.subscriber("healthcheck_resp")
+async def healthcheck_resp_sub(body):
+    global_state["healthcheck_resp"].append("xx")
+
+
+@bus.subscriber(LOAD_SUBJECT)
+async def load_sub(stats):
+    load_monitor.update(stats)
@@ -2,14 +2,47 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from pac0.service.api_gateway.lib.api import router as router_api
-from pac0.service.api_gateway.lib.bus import router as router_bus
+from pac0.shared.esb import SettingsService, get_flow_store
+
+settings = SettingsService()
+
+if settings.runtime == "monolith":
+    # every brique in this process, over the in-memory bus
+    from pac0.service.api_gateway.lib import local_bus  # noqa: F401
+    from pac0.shared import monolith
+    from pac0.shared.membus import bus
+    from pac0.shared.metrics import CONTENT_TYPE, hop_latency
+
+    monolith.load_briques()
 
-app = FastAPI()
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await monolith.startup()
+        yield
+        await monolith.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.broker = bus
+
+    @app.get("/metrics")
+    async def metrics_get():
+        """per stage latency histograms, aggregated by gestion_cycle_vie"""
+        return PlainTextResponse(hop_latency.render(), media_type=CONTENT_TYPE)
+else:
+    from pac0.service.api_gateway.lib.bus import router as router_bus
+
+    app = FastAPI()
+    app.include_router(router_bus)
+    app.state.broker = router_bus.broker
 
-app.include_router(router_bus)
 app.include_router(router_api)
 
+# flow lifecycle states, recorded by gestion_cycle_vie
+app.state.flow_store = get_flow_store(settings, app.state.broker)
+
 app.state.rank = "dev"
-app.state.broker = router_bus.broker
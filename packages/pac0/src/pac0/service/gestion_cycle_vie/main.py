@@ -2,90 +2,194 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from pac0.shared.esb import init_esb_app
+import logging
+from typing import Any
+
+from faststream.asgi import AsgiResponse, get
+from faststream.nats import JStream
+from nats.js.api import RetentionPolicy
+
+from pac0.shared.backpressure import LOAD_SUBJECT, LoadMonitor
+from pac0.shared.envelope import decode, encode, is_envelope
+from pac0.shared.esb import LIFECYCLE_SUBJECT, get_flow_store, init_esb_app
+from pac0.shared.flowstore import DONE, ERROR, FlowEvent
+from pac0.shared.metrics import CONTENT_TYPE, hop_latency
+from pac0.shared.pipeline import settings_pipelines
+from pac0.shared.priority import PRIORITY_HEADER
+from pac0.shared.retry import (
+    ATTEMPT_HEADER,
+    DLQ_PREFIX,
+    Retry,
+    RetryScheduler,
+    dlq_subject,
+)
+
+logger = logging.getLogger(__name__)
 
 
 ctx, broker, app = init_esb_app("gestion-cycle-vie")
 
+# load of the pipeline stages (backpressure)
+monitor = LoadMonitor.from_settings(ctx.settings)
 
-# X="api-gateway-OUT"
-SUBJECT_01_ERR = "api-gateway-ERR"
-SUBJECT_01_OUT = "api-gateway-OUT"
-SUBJECT_02_ERR = "esb-central-ERR"
-SUBJECT_03_IN = "controle-formats-IN"
-SUBJECT_03_OUT = "controle-formats-OUT"
-SUBJECT_03_ERR = "controle-formats-ERR"
-SUBJECT_04_IN = "validation-metier-IN"
-SUBJECT_04_OUT = "validation-metier-OUT"
-SUBJECT_04_ERR = "validation-metier-ERR"
-SUBJECT_05_IN = "conversion-formats-IN"
-SUBJECT_05_OUT = "conversion-formats-OUT"
-SUBJECT_05_ERR = "conversion-formats-ERR"
-SUBJECT_06_IN = "annuaire-local-IN"
-SUBJECT_06_OUT = "annuaire-local-OUT"
-SUBJECT_06_ERR = "annuaire-local-ERR"
-SUBJECT_07_IN = "routage-IN"
-SUBJECT_07_OUT = "routage-OUT"
-SUBJECT_07_ERR = "routage-ERR"
-SUBJECT_08_IN = "transmission-fiscale-IN"
-SUBJECT_08_OUT = "transmission-fiscale-OUT"
-SUBJECT_08_ERR = "transmission-fiscale-ERR"
-SUBJECT_09_ERR = "gestion-cycle-vie-ERR"
-
-
-publisher_03_IN = broker.publisher(SUBJECT_03_IN)
-publisher_04_IN = broker.publisher(SUBJECT_04_IN)
-publisher_05_IN = broker.publisher(SUBJECT_05_IN)
-publisher_06_IN = broker.publisher(SUBJECT_06_IN)
-publisher_07_IN = broker.publisher(SUBJECT_07_IN)
-publisher_08_IN = broker.publisher(SUBJECT_08_IN)
+# hops between the briques, compiled from pipeline.yaml
+dispatch = settings_pipelines(ctx.settings)
 
-publisher_err = broker.publisher(SUBJECT_09_ERR)
+# lifecycle state of the flows (GET /flows/{flowId} on the api gateway)
+flow_store = get_flow_store(ctx.settings, broker)
 
 
-@broker.subscriber(SUBJECT_01_OUT, ctx.queue)
-async def process_01_to_03(message):
-    await publisher_03_IN.publish(message, correlation_id=message.correlation_id)
-
+# stages whose errors are handled here (`<stage>-ERR`)
+ERR_STAGES = (
+    "api-gateway",
+    "esb-central",
+    "controle-formats",
+    "validation-metier",
+    "conversion-formats",
+    "annuaire-local",
+    "routage",
+    "transmission-fiscale",
+)
+SUBJECT_09_ERR = "gestion-cycle-vie-ERR"
 
-@broker.subscriber(SUBJECT_03_OUT, ctx.queue)
-async def process_03_to_04(message):
-    await publisher_04_IN.publish(message, correlation_id=message.correlation_id)
 
+# publisher on `<stage>-IN`, for every stage of the pipelines
+publishers_in = {stage: ctx.publisher(f"{stage}-IN") for stage in dispatch.targets}
+
+publisher_err = ctx.publisher(SUBJECT_09_ERR)
+
+# retries go back to `<stage>-IN`, dead letters to `esb-dlq.<stage>`
+publishers_retry = {
+    stage: publishers_in.get(stage) or ctx.publisher(f"{stage}-IN")
+    for stage in ERR_STAGES
+}
+dlq_stream = None
+if ctx.settings.jetstream:
+    # kept until replayed (python -m pac0.shared.dlq)
+    dlq_stream = JStream(
+        ctx.settings.dlq_stream,
+        subjects=[f"{DLQ_PREFIX}.>"],
+        retention=RetentionPolicy.WORK_QUEUE,
+    )
+publishers_dlq = {
+    stage: broker.publisher(dlq_subject(stage), stream=dlq_stream)
+    for stage in ERR_STAGES
+}
+
+
+@broker.subscriber(LOAD_SUBJECT)
+async def process_load(stats: dict[str, Any]):
+    monitor.update(stats)
 
-@broker.subscriber(SUBJECT_04_OUT, ctx.queue)
-async def process_04_to_05(message):
-    await publisher_05_IN.publish(message, correlation_id=message.correlation_id)
+
+async def forward(publisher, message):
+    """publish to the next stage, once it is not saturated anymore"""
+    stage = publisher.subject.removesuffix("-IN")
+    await monitor.wait_ready(stage, ctx.settings.backpressure_max_wait)
+    await publisher.publish(message, correlation_id=ctx.correlation_id())
 
 
-@broker.subscriber(SUBJECT_05_OUT, ctx.queue)
-async def process_05_to_06(message):
-    await publisher_06_IN.publish(message, correlation_id=message.correlation_id)
+async def record(stage: str, envelope, **kwargs):
+    """record the flow lifecycle event (flow id: correlation id)"""
+    flow_id = ctx.correlation_id()
+    if flow_id:
+        await flow_store.append(
+            FlowEvent.from_envelope(flow_id, stage, envelope, **kwargs)
+        )
+
+
+def hop(source: str):
+    """handler of `<source>-OUT`: dispatch to the next stage"""
+    # choreography: the flow gets its routing slip at intake, then the
+    # briques publish directly to the next stage
+    intake = ctx.settings.choreography and source in dispatch.entries
+
+    async def process(message):
+        hop_latency.observe_headers(ctx.message_headers())
+        envelope = decode(message) if is_envelope(message) else None
+        target = dispatch.route(source, envelope)
+        if target is None:
+            # end of the flow
+            await record(source, envelope, status=DONE)
+            return
+        if intake and envelope is not None:
+            slip = ",".join(dispatch.slip(envelope, target))
+            message = encode(envelope.replace(routing_slip=slip))
+        await forward(publishers_in[target], message)
+        await record(source, envelope)
+
+    process.__name__ = process.__qualname__ = f"process_{source}"
+    return process
+
+
+for stage in dispatch.stages:
+    ctx.subscriber(f"{stage}-OUT")(hop(stage))
+
+
+@ctx.subscriber(LIFECYCLE_SUBJECT)
+async def process_lifecycle(event: dict[str, Any]):
+    """choreography: hops done by the briques, off the critical path"""
+    logger.debug(f"{event['invoice_id']}: {event['stage']} -> {event['next']}")
+    hop_latency.observe_headers(event.get("hop"))
+    await flow_store.append(
+        FlowEvent(
+            flow_id=event["correlation_id"],
+            stage=event["stage"],
+            tracking_id=event.get("tracking_id", ""),
+            sirens=event.get("sirens", []),
+        )
+    )
+
+
+async def redeliver(retry: Retry):
+    """publish a failed message again on `<stage>-IN`"""
+    await publishers_retry[retry.stage].publish(
+        retry.message,
+        headers={ATTEMPT_HEADER: retry.headers[ATTEMPT_HEADER]},
+        priority=retry.headers.get(PRIORITY_HEADER),
+        correlation_id=retry.correlation_id,
+    )
+
+
+async def dead_letter(retry: Retry):
+    logger.warning(f"{retry.stage}: dead letter {retry.correlation_id}")
+    await publishers_dlq[retry.stage].publish(
+        retry.message, headers=retry.headers, correlation_id=retry.correlation_id
+    )
+
+
+retries = RetryScheduler.from_settings(ctx.settings, redeliver, dead_letter)
+ctx.shutdown_hooks.append(retries.stop)
+
+
+def fail(stage: str):
+    """handler of `<stage>-ERR`: retry transient errors, else dead letter"""
+
+    async def process_err(message):
+        envelope = decode(message) if is_envelope(message) else None
+        retried = await retries.failed(
+            stage, message, ctx.message_headers(), ctx.correlation_id()
+        )
+        if not retried:
+            await record(stage, envelope, status=ERROR)
 
+    process_err.__name__ = process_err.__qualname__ = f"process_err_{stage}"
+    return process_err
 
-@broker.subscriber(SUBJECT_06_OUT, ctx.queue)
-async def process_06_to_07(message):
-    # TODO: ne faire le routage que si non présent dans l'annuaire
-    # TODO: trouver `dans_annuaire_local` dans `message`
-    dans_annuaire_local = True
-    # soit on passe à 07 ou à 08
-    next_publisher = publisher_07_IN if not dans_annuaire_local else publisher_08_IN
-    await next_publisher.publish(message, correlation_id=message.correlation_id)
 
+for stage in ERR_STAGES:
+    ctx.subscriber(f"{stage}-ERR")(fail(stage))
 
-@broker.subscriber(SUBJECT_07_OUT, ctx.queue)
-async def process_07_to_08(message):
-    await publisher_08_IN.publish(message, correlation_id=message.correlation_id)
 
+@get
+async def metrics(scope):
+    """per stage latency histograms (queue wait, processing)"""
+    return AsgiResponse(
+        hop_latency.render().encode(), headers={"content-type": CONTENT_TYPE}
+    )
 
-@broker.subscriber(SUBJECT_01_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_02_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_03_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_04_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_05_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_06_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_07_ERR, ctx.queue)
-@broker.subscriber(SUBJECT_08_ERR, ctx.queue)
-async def process_err(message):
-    # TODO: common err behaviour
-    ...
+
+# with the HTTP metrics endpoint:
+# uv run faststream run src/pac0/service/gestion_cycle_vie/main:asgi
+if app is not None:
+    asgi = app.as_asgi(asgi_routes=[("/metrics", metrics)])
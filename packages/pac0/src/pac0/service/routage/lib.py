@@ -12,6 +12,7 @@ via PEPPOL ou vers le PPF en fallback.
 from typing import Optional
 
 
+from pac0.shared.envelope import Envelope, decode, encode, is_envelope
 from pac0.shared.esb import QUEUE
 
 from .models import InvoiceMessage, RoutingResult, RoutingStatus
@@ -40,10 +41,13 @@ def set_peppol_service(service: PeppolLookupService):
     _peppol_service = service
 
 
-async def route_invoice(message: InvoiceMessage) -> RoutingResult:
+async def route_invoice(message: InvoiceMessage | Envelope) -> RoutingResult:
     """
     Route une facture vers la destination appropriée.
 
+    Seules les métadonnées sont utilisées: une enveloppe binaire est routée
+    sans lire son payload.
+
     Logique de routage:
     1. Si le destinataire est local, ne pas router (erreur)
     2. Sinon, lookup PEPPOL pour trouver la PA du destinataire
@@ -108,6 +112,21 @@ async def process(message):
     la destination appropriée.
     """
     try:
+        # Enveloppe binaire: routage sur l'en-tête, payload transmis tel quel
+        if is_envelope(message):
+            envelope = decode(message)
+            routing_result = await route_invoice(envelope)
+            publisher = (
+                publisher_err
+                if routing_result.status == RoutingStatus.ERROR
+                else publisher_out
+            )
+            await publisher.publish(
+                encode(envelope.replace(status=routing_result.status.value)),
+                correlation_id=message.correlation_id,
+            )
+            return
+
         # Parser le message si c'est un dict
         if isinstance(message, dict):
             invoice_message = InvoiceMessage(**message)
@@ -10,8 +10,8 @@ ctx, broker, app = init_esb_app("routage")
 # publisher = ctx.broker.publisher("test")
 
 
-@broker.subscriber(ctx.subject_in, ctx.queue)
+@ctx.subscriber()
 async def process(message):
-    await ctx.publisher_out.publish(message, correlation_id=message.correlation_id)
-    # await publisher_err.publish(message, correlation_id=message.correlation_id)
+    await ctx.publish_out(message)
+    # await publisher_err.publish(message, correlation_id=ctx.correlation_id())
     # TODO see lib.process()
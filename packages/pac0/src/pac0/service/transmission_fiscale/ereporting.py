@@ -0,0 +1,311 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+E-reporting batches: transactions are reported by periodic flux files,
+not one call per invoice.
+
+The transactions (envelope messages) are buffered by batch: sender SIREN
+and period (`ereporting_period`). A batch is submitted when it reaches
+`ereporting_batch_size` transactions or `ereporting_batch_bytes`, when
+it is `ereporting_batch_window` seconds old, or on flush (shutdown).
+
+Buffers are in memory up to `ereporting_memory_limit` bytes, then the
+largest batches are spilled to disk (`ereporting_spill_dir`). Spilled
+batches left by a previous process are recovered at startup.
+
+A batch is built once into a single compressed submission file (zip:
+manifest + one file per transaction) and sent by the transmitter
+(`ereporting_transmitter`): `local` writes the files in
+`ereporting_dir` (stand-in for the tax administration), or any
+`module:factory` returning a `Transmitter` for the settings.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import importlib
+import io
+import json
+import logging
+from pathlib import Path
+import struct
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Protocol
+import zipfile
+
+from pac0.shared.envelope import decode
+
+logger = logging.getLogger(__name__)
+
+# spill file record: correlation id length, message length
+_RECORD = struct.Struct("!HI")
+
+
+def period_of(timestamp: float, kind: str = "month") -> str:
+    """Reporting period of a transaction ("day", "decade" or "month")."""
+    day = datetime.fromtimestamp(timestamp, timezone.utc)
+    if kind == "day":
+        return day.strftime("%Y-%m-%d")
+    if kind == "decade":
+        # 1-10, 11-20, 21-end of month
+        return f"{day:%Y-%m}-D{min((day.day - 1) // 10, 2) + 1}"
+    if kind == "month":
+        return day.strftime("%Y-%m")
+    raise ValueError(f"unknown period {kind!r}")
+
+
+@dataclass
+class Batch:
+    """Transactions of a SIREN for a period."""
+
+    siren: str
+    period: str
+    created_at: float = field(default_factory=time.monotonic)
+    # (correlation id, message) in memory
+    records: list[tuple[str, bytes]] = field(default_factory=list)
+    # transactions spilled to disk
+    spilled: int = 0
+    size: int = 0
+    # bytes of `records`
+    memory: int = 0
+    timer: asyncio.TimerHandle | None = None
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.siren, self.period
+
+    def __len__(self) -> int:
+        return len(self.records) + self.spilled
+
+
+@dataclass
+class Submission:
+    """Flux file of a batch."""
+
+    siren: str
+    period: str
+    count: int
+    filename: str
+    data: bytes
+
+
+class Transmitter(Protocol):
+    async def send(self, submission: Submission) -> str:
+        """Send a submission, returns its receipt."""
+        ...
+
+
+class LocalTransmitter:
+    """Stand-in transmitter: the submissions are written in a directory."""
+
+    def __init__(self, directory: str | Path | None = None):
+        self.directory = Path(
+            directory or Path(tempfile.gettempdir()) / "pac0-ereporting"
+        )
+
+    async def send(self, submission: Submission) -> str:
+        path = self.directory / submission.filename
+        await asyncio.to_thread(self._write, path, submission.data)
+        return str(path)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+
+def get_transmitter(settings) -> Transmitter:
+    """Transmitter configured by the settings."""
+    name = settings.ereporting_transmitter
+    if name == "local":
+        return LocalTransmitter(settings.ereporting_dir)
+    module, _, factory = name.partition(":")
+    return getattr(importlib.import_module(module), factory)(settings)
+
+
+def build_submission(
+    siren: str, period: str, transactions: list[tuple[str, bytes]]
+) -> Submission:
+    """Zip of the manifest and of the transactions (invoice id, payload)."""
+    created = datetime.now(timezone.utc)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        manifest = {
+            "siren": siren,
+            "period": period,
+            "count": len(transactions),
+            "created_at": created.isoformat(),
+            "transactions": [invoice_id for invoice_id, _ in transactions],
+        }
+        archive.writestr("manifest.json", json.dumps(manifest))
+        for i, (invoice_id, payload) in enumerate(transactions):
+            archive.writestr(f"{i:06d}-{invoice_id or 'transaction'}.xml", payload)
+    return Submission(
+        siren=siren,
+        period=period,
+        count=len(transactions),
+        filename=f"{siren}_{period}_{created:%Y%m%dT%H%M%S%f}.zip",
+        data=buffer.getvalue(),
+    )
+
+
+class Aggregator:
+    """Buffer the transactions by batch and submit the full batches."""
+
+    def __init__(
+        self,
+        submit: Callable[[Batch, list[tuple[str, bytes]]], Awaitable[None]],
+        batch_size: int = 1000,
+        batch_bytes: int = 16 * 1024 * 1024,
+        window: float = 300.0,
+        memory_limit: int = 64 * 1024 * 1024,
+        spill_dir: str | Path | None = None,
+        period: str = "month",
+    ):
+        self.submit = submit
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.window = window
+        self.memory_limit = memory_limit
+        self.spill_dir = Path(
+            spill_dir or Path(tempfile.gettempdir()) / "pac0-ereporting-spill"
+        )
+        self.period = period
+        self.batches: dict[tuple[str, str], Batch] = {}
+        # bytes buffered in memory
+        self.memory = 0
+        self._recovered = False
+        self._flushing: set[asyncio.Task] = set()
+        # spill files writes / renames
+        self._io = asyncio.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, submit) -> "Aggregator":
+        return cls(
+            submit,
+            batch_size=settings.ereporting_batch_size,
+            batch_bytes=settings.ereporting_batch_bytes,
+            window=settings.ereporting_batch_window,
+            memory_limit=settings.ereporting_memory_limit,
+            spill_dir=settings.ereporting_spill_dir,
+            period=settings.ereporting_period,
+        )
+
+    def _batch(self, siren: str, period: str) -> Batch:
+        batch = self.batches.get((siren, period))
+        if batch is None:
+            batch = self.batches[siren, period] = Batch(siren, period)
+            loop = asyncio.get_running_loop()
+            batch.timer = loop.call_later(self.window, self._flush_later, batch.key)
+        return batch
+
+    async def add(self, message: bytes, correlation_id: str | None) -> None:
+        """Buffer a transaction (envelope message)."""
+        await self.recover()
+        envelope = decode(message)
+        batch = self._batch(envelope.sender_siren, period_of(time.time(), self.period))
+        message = bytes(message)
+        batch.records.append((correlation_id or "", message))
+        batch.size += len(message)
+        batch.memory += len(message)
+        self.memory += len(message)
+        if len(batch) >= self.batch_size or batch.size >= self.batch_bytes:
+            await self.flush_batch(batch.key)
+        elif self.memory > self.memory_limit:
+            await self._spill_largest()
+
+    def _spill_path(self, siren: str, period: str) -> Path:
+        return self.spill_dir / f"{siren}_{period}.spill"
+
+    async def _spill_largest(self) -> None:
+        while self.memory > self.memory_limit:
+            batch = max(self.batches.values(), key=lambda b: b.memory)
+            if not batch.records:
+                return
+            records, batch.records = batch.records, []
+            self.memory -= batch.memory
+            batch.memory = 0
+            batch.spilled += len(records)
+            path = self._spill_path(batch.siren, batch.period)
+            async with self._io:
+                await asyncio.to_thread(self._write_spill, path, records)
+
+    def _write_spill(self, path: Path, records: list[tuple[str, bytes]]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as f:
+            for correlation_id, message in records:
+                cid = correlation_id.encode()
+                f.write(_RECORD.pack(len(cid), len(message)) + cid + message)
+
+    def _read_spill(self, path: Path) -> list[tuple[str, bytes]]:
+        records = []
+        with open(path, "rb") as f:
+            while header := f.read(_RECORD.size):
+                cid_len, size = _RECORD.unpack(header)
+                correlation_id = f.read(cid_len).decode()
+                records.append((correlation_id, f.read(size)))
+        return records
+
+    async def recover(self) -> None:
+        """Batches spilled by a previous process."""
+        if self._recovered:
+            return
+        self._recovered = True
+        if not self.spill_dir.exists():
+            return
+        # batches whose submission failed go back to their spill file
+        for path in self.spill_dir.glob("*.sending"):
+            records = await asyncio.to_thread(self._read_spill, path)
+            spill = path.with_suffix(".spill")
+            await asyncio.to_thread(self._write_spill, spill, records)
+            path.unlink()
+        for path in self.spill_dir.glob("*.spill"):
+            siren, _, period = path.stem.partition("_")
+            batch = self._batch(siren, period)
+            records = await asyncio.to_thread(self._read_spill, path)
+            batch.spilled += len(records)
+            batch.size += sum(len(m) for _, m in records)
+            logger.info(f"e-reporting {siren} {period}: {len(records)} recovered")
+
+    def _flush_later(self, key: tuple[str, str]) -> None:
+        task = asyncio.create_task(self.flush_batch(key))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush_batch(self, key: tuple[str, str]) -> None:
+        """Submit a batch now."""
+        batch = self.batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        records = batch.records
+        self.memory -= batch.memory
+        sending = None
+        if batch.spilled:
+            # a new batch of the same key spills to a new file
+            async with self._io:
+                spill = self._spill_path(batch.siren, batch.period)
+                sending = spill.with_suffix(".sending")
+                spill.replace(sending)
+            records = await asyncio.to_thread(self._read_spill, sending) + records
+        try:
+            await self.submit(batch, records)
+        except Exception:
+            # the spilled part is recovered at the next startup
+            logger.exception(f"e-reporting {batch.siren} {batch.period} failed")
+            return
+        if sending is not None:
+            sending.unlink()
+
+    async def flush(self) -> None:
+        """Submit every batch (shutdown)."""
+        for key in list(self.batches):
+            await self.flush_batch(key)
+        pending = self._flushing - {asyncio.current_task()}
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -2,13 +2,60 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import asyncio
+import logging
+
+from pac0.service.transmission_fiscale.ereporting import (
+    Aggregator,
+    Batch,
+    build_submission,
+    get_transmitter,
+)
+from pac0.shared.envelope import decode, is_envelope
 from pac0.shared.esb import init_esb_app
 
+logger = logging.getLogger(__name__)
+
 
 ctx, broker, app = init_esb_app("transmission-fiscale")
 
+# e-reporting: one submission per batch of transactions
+transmitter = get_transmitter(ctx.settings)
+
+
+async def submit(batch: Batch, records: list[tuple[str, bytes]]):
+    envelopes = [decode(message) for _, message in records]
+    transactions = [(e.invoice_id, bytes(await ctx.check_out(e))) for e in envelopes]
+    submission = await asyncio.to_thread(
+        build_submission, batch.siren, batch.period, transactions
+    )
+    try:
+        receipt = await transmitter.send(submission)
+    except Exception as e:
+        logger.warning(f"e-reporting {batch.siren} {batch.period}: {e!r}")
+        # retried one by one (see gestion_cycle_vie), then batched again
+        for correlation_id, message in records:
+            await ctx.publish_err(
+                message, "UNAVAILABLE", str(e), correlation_id=correlation_id
+            )
+        return
+    logger.info(f"e-reporting {batch.siren} {batch.period}: {receipt}")
+    # end of the flow of every transaction
+    await asyncio.gather(
+        *(ctx.publish_out(message, correlation_id=cid) for cid, message in records)
+    )
+
+
+aggregator = Aggregator.from_settings(ctx.settings, submit)
+# submit the pending batches on shutdown
+ctx.flush_hooks.append(aggregator.flush)
+if app is not None:
+    app.after_startup(aggregator.recover)
+
 
-@broker.subscriber(ctx.subject_in, ctx.queue)
+@ctx.subscriber()
 async def process(message):
-    await ctx.publisher_out.publish(message, correlation_id=message.correlation_id)
-    # await publisher_err.publish(message, correlation_id=message.correlation_id)
+    if not is_envelope(message):
+        await ctx.publish_out(message)
+        return
+    await aggregator.add(message, ctx.correlation_id())
@@ -8,7 +8,7 @@ from pac0.shared.esb import init_esb_app
 ctx, broker, app = init_esb_app("validation-metier")
 
 
-@broker.subscriber(ctx.subject_in, ctx.queue)
+@ctx.subscriber()
 async def process(message):
-    await ctx.publisher_out.publish(message, correlation_id=message.correlation_id)
-    # await publisher_err.publish(message, correlation_id=message.correlation_id)
+    await ctx.publish_out(message)
+    # await publisher_err.publish(message, correlation_id=ctx.correlation_id())
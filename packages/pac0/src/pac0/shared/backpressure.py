@@ -0,0 +1,121 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Backpressure across the pipeline.
+
+Every brique periodically publishes its load (`CtxService.stats()`) on
+`LOAD_SUBJECT`. A `LoadMonitor` collects those reports and tells whether a
+stage is saturated: its depth (handlers running + waiting) reaches
+`high` x `max_inflight`, and it is released once the depth goes back
+under `low` x `max_inflight` (hysteresis, to avoid flapping).
+
+* gestion_cycle_vie waits for the next stage to be ready before forwarding
+* api_gateway refuses new flows (503 + Retry-After) while a stage is saturated
+
+Reports older than `stale_after` seconds are ignored (stopped service).
+"""
+
+import asyncio
+from dataclasses import dataclass
+import math
+import time
+from typing import Any
+
+LOAD_SUBJECT = "esb-load"
+
+
+@dataclass
+class StageLoad:
+    service: str
+    depth: int
+    capacity: int
+    at: float
+    saturated: bool = False
+
+
+class LoadMonitor:
+    """Load of the pipeline stages, fed by the load reports."""
+
+    def __init__(
+        self,
+        high: float = 1.0,
+        low: float = 0.5,
+        stale_after: float = 5.0,
+        interval: float = 1.0,
+    ):
+        self.high = high
+        self.low = low
+        self.stale_after = stale_after
+        self.interval = interval
+        self._stages: dict[str, StageLoad] = {}
+        self._ready: dict[str, asyncio.Event] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "LoadMonitor":
+        return cls(
+            high=settings.backpressure_high,
+            low=settings.backpressure_low,
+            stale_after=settings.load_stale_after,
+            interval=settings.load_report_interval,
+        )
+
+    def _event(self, service: str) -> asyncio.Event:
+        if service not in self._ready:
+            self._ready[service] = asyncio.Event()
+            self._ready[service].set()
+        return self._ready[service]
+
+    def update(self, stats: dict[str, Any]) -> None:
+        """Record a load report (see `CtxService.stats()`)."""
+        service = stats["service"]
+        depth = stats.get("queued", stats.get("inflight", 0))
+        capacity = stats.get("max_inflight", 0)
+        previous = self._stages.get(service)
+        saturated = previous.saturated if previous else False
+        if capacity > 0:
+            if depth >= self.high * capacity:
+                saturated = True
+            elif depth <= self.low * capacity:
+                saturated = False
+        else:
+            saturated = False
+        self._stages[service] = StageLoad(
+            service, depth, capacity, time.monotonic(), saturated
+        )
+        event = self._event(service)
+        if saturated:
+            event.clear()
+        else:
+            event.set()
+
+    def is_saturated(self, service: str) -> bool:
+        stage = self._stages.get(service)
+        if stage is None or time.monotonic() - stage.at > self.stale_after:
+            return False
+        return stage.saturated
+
+    def saturated(self) -> list[str]:
+        """Saturated stages."""
+        return [s for s in self._stages if self.is_saturated(s)]
+
+    async def wait_ready(self, service: str, timeout: float | None = None) -> bool:
+        """
+        Wait until `service` is not saturated (False on timeout).
+
+        A stale report does not block: the wait is bounded by `stale_after`.
+        """
+        if not self.is_saturated(service):
+            return True
+        if timeout is None:
+            timeout = self.stale_after
+        try:
+            await asyncio.wait_for(self._event(service).wait(), timeout)
+            return True
+        except TimeoutError:
+            return not self.is_saturated(service)
+
+    def retry_after(self) -> int:
+        """Suggested client delay (seconds) while the pipeline is saturated."""
+        return max(1, math.ceil(2 * self.interval))
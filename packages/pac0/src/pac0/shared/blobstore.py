@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Claim-check for large invoice payloads.
+
+Payloads above a threshold are stored once in a content-addressed blob
+store (key: `sha256:<hex>`) and the envelope only carries the key
+(flag `FLAG_CLAIM_CHECK`). Briques fetch the payload with `check_out()`
+only when they need it: hops working on metadata never download it.
+
+Stores:
+* `LocalBlobStore`: local disk stand-in (one file per blob)
+* `NatsBlobStore`: NATS JetStream object store
+"""
+
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Protocol
+
+from nats.js.errors import ObjectNotFoundError
+
+from pac0.shared.envelope import FLAG_CLAIM_CHECK, Envelope
+
+KEY_PREFIX = "sha256:"
+
+
+class BlobNotFoundError(KeyError):
+    """No blob for this key."""
+
+
+class BlobStore(Protocol):
+    """Content-addressed blob store."""
+
+    async def put(self, data: bytes) -> str:
+        """Store `data` and return its key (idempotent)."""
+        ...
+
+    async def get(self, key: str) -> bytes:
+        """Return the blob for `key` (`BlobNotFoundError` if unknown)."""
+        ...
+
+
+def blob_key(data: bytes | memoryview) -> str:
+    """Content address of `data`."""
+    return KEY_PREFIX + hashlib.sha256(data).hexdigest()
+
+
+def _digest(key: str) -> str:
+    if not key.startswith(KEY_PREFIX):
+        raise BlobNotFoundError(key)
+    digest = key[len(KEY_PREFIX) :]
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise BlobNotFoundError(key)
+    return digest
+
+
+class LocalBlobStore:
+    """Blob store on local disk: `<root>/<2 first hex chars>/<digest>`."""
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root or Path(tempfile.gettempdir()) / "pac0-blobs")
+
+    def _path(self, key: str) -> Path:
+        digest = _digest(key)
+        return self.root / digest[:2] / digest
+
+    def _put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # atomic write: a reader never sees a partial blob
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _get(self, key: str) -> bytes:
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError as e:
+            raise BlobNotFoundError(key) from e
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        await asyncio.to_thread(self._put, key, data)
+        return key
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._get, key)
+
+
+class NatsBlobStore:
+    """Blob store on a NATS JetStream object store bucket."""
+
+    def __init__(self, broker: Any, bucket: str = "pac0-payloads"):
+        self.broker = broker
+        self.bucket = bucket
+        self._store = None
+
+    async def _object_store(self):
+        if self._store is None:
+            self._store = await self.broker.object_storage(self.bucket)
+        return self._store
+
+    async def put(self, data: bytes) -> str:
+        key = blob_key(data)
+        store = await self._object_store()
+        try:
+            await store.get_info(key)
+        except ObjectNotFoundError:
+            await store.put(key, data)
+        return key
+
+    async def get(self, key: str) -> bytes:
+        _digest(key)
+        store = await self._object_store()
+        try:
+            result = await store.get(key)
+        except ObjectNotFoundError as e:
+            raise BlobNotFoundError(key) from e
+        return result.data
+
+
+async def check_in(envelope: Envelope, store: BlobStore, threshold: int) -> Envelope:
+    """Move the payload to `store` if larger than `threshold` bytes."""
+    if envelope.flags & FLAG_CLAIM_CHECK or len(envelope.payload) <= threshold:
+        return envelope
+    key = await store.put(bytes(envelope.payload))
+    return envelope.replace(
+        payload=key.encode(), flags=envelope.flags | FLAG_CLAIM_CHECK
+    )
+
+
+async def check_out(envelope: Envelope, store: BlobStore) -> bytes | memoryview:
+    """Return the envelope payload, fetched from `store` if claim-checked."""
+    if not envelope.flags & FLAG_CLAIM_CHECK:
+        return envelope.payload
+    return await store.get(str(envelope.payload, "ascii"))
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Payload compression for the invoice envelopes.
+
+The producer compresses the payload once, the encoding is recorded in the
+`content_encoding` envelope header and the payload stays compressed on
+every hop: a brique only decompresses it when it reads it (see
+`CtxService.check_out()`).
+
+Encodings (`content_encoding` values):
+* `""`: not compressed
+* `"gzip"`: always available
+* `"zstd"`: needs the optional `zstandard` package
+* `"zstd;dict=<id>"`: zstd with a shared dictionary trained on UBL/CII
+  invoices (see `train_dictionary()`), every brique must load it
+
+With `algorithm="auto"`, zstd is used when available, gzip otherwise.
+"""
+
+import gzip
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = ""
+
+
+class CompressionError(ValueError):
+    """Unknown or unsupported content encoding."""
+
+
+def _dict_param(encoding: str) -> int | None:
+    _, _, param = encoding.partition(";")
+    if not param:
+        return None
+    key, _, value = param.partition("=")
+    if key.strip() != "dict" or not value.strip().isdigit():
+        raise CompressionError(f"invalid content encoding {encoding!r}")
+    return int(value)
+
+
+class Compressor:
+    """Compress / decompress payloads, shared by the briques of a process."""
+
+    def __init__(
+        self,
+        algorithm: str = "auto",
+        level: int = 3,
+        min_size: int = 1024,
+        dictionary: bytes | None = None,
+    ):
+        if algorithm == "auto":
+            algorithm = ZSTD if zstandard is not None else GZIP
+        if algorithm not in (ZSTD, GZIP, "none"):
+            raise CompressionError(f"unknown compression {algorithm!r}")
+        if algorithm == ZSTD and zstandard is None:
+            raise CompressionError("zstd compression needs `zstandard`")
+        self.algorithm = algorithm
+        self.level = level
+        self.min_size = min_size
+
+        self._dict = None
+        if dictionary is not None and zstandard is not None:
+            self._dict = zstandard.ZstdCompressionDict(dictionary)
+
+    @classmethod
+    def from_settings(cls, settings) -> "Compressor":
+        dictionary = None
+        if settings.compression_dict:
+            dictionary = Path(settings.compression_dict).read_bytes()
+        return cls(
+            algorithm=settings.compression,
+            level=settings.compression_level,
+            min_size=settings.compression_min_size,
+            dictionary=dictionary,
+        )
+
+    @property
+    def encoding(self) -> str:
+        """Encoding produced by `compress()`."""
+        if self.algorithm == ZSTD and self._dict is not None:
+            return f"{ZSTD};dict={self._dict.dict_id()}"
+        if self.algorithm == "none":
+            return IDENTITY
+        return self.algorithm
+
+    def compress(self, data: bytes | memoryview) -> tuple[bytes | memoryview, str]:
+        """Compressed `data` and its encoding (unchanged if too small)."""
+        if self.algorithm == "none" or len(data) < self.min_size:
+            return data, IDENTITY
+        if self.algorithm == ZSTD:
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dict
+            )
+            compressed = compressor.compress(data)
+        else:
+            compressed = gzip.compress(data, compresslevel=min(self.level, 9))
+        if len(compressed) >= len(data):
+            return data, IDENTITY
+        return compressed, self.encoding
+
+    def decompress(self, data: bytes | memoryview, encoding: str) -> bytes | memoryview:
+        """Decompress `data` encoded with `encoding`."""
+        if encoding == IDENTITY:
+            return data
+        name = encoding.partition(";")[0].strip()
+        if name == GZIP:
+            return gzip.decompress(data)
+        if name != ZSTD:
+            raise CompressionError(f"unknown content encoding {encoding!r}")
+        if zstandard is None:
+            raise CompressionError("zstd content encoding needs `zstandard`")
+        dict_id = _dict_param(encoding)
+        dict_data = None
+        if dict_id is not None:
+            if self._dict is None or self._dict.dict_id() != dict_id:
+                raise CompressionError(f"unknown zstd dictionary {dict_id}")
+            dict_data = self._dict
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(data)
+
+
+def train_dictionary(samples: list[bytes], size: int = 112 * 1024) -> bytes:
+    """
+    Train a zstd dictionary on sample invoices (UBL/CII XML).
+
+    Save the result in a file and point `PAC0_COMPRESSION_DICT` to it on
+    every brique.
+    """
+    if zstandard is None:
+        raise CompressionError("zstd dictionaries need `zstandard`")
+    return zstandard.train_dictionary(size, samples).as_bytes()
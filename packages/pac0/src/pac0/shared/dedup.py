@@ -0,0 +1,190 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Idempotent processing: drop the messages a service already handled.
+
+Every published message gets a unique id (`pac0-message-id` header, kept
+by JetStream redeliveries; a client may set it, ex: idempotency key).
+Before a handler runs, `(stage, message id)` is looked up in:
+
+* an LRU cache of the last `dedup_cache_size` ids (exact)
+* a time-windowed Bloom filter (two generations of `dedup_window`
+  seconds): ids evicted from the LRU are still known, for a few bytes
+  each (false positive rate: `dedup_error_rate`, the message is dropped)
+* or, with `dedup_kv`, a NATS JetStream KV bucket (ttl: `dedup_window`)
+  shared by the replicas of the service, instead of the Bloom filter
+
+Every lookup is O(1) and the memory is bounded whatever the traffic.
+An id is recorded once the handler succeeds, so a failed message is
+still redelivered.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+import time
+from typing import Any
+
+from nats.js.errors import KeyNotFoundError
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ID_HEADER = "pac0-message-id"
+
+
+class LRUCache:
+    """Set of the `maxsize` last added keys."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._keys: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key: str) -> None:
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+
+class BloomFilter:
+    """Bloom filter sized for `capacity` keys at `error_rate` false positives."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, math.ceil(bits))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, key: str):
+        # double hashing: h1 + i x h2
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(key))
+
+    def add(self, key: str) -> None:
+        for i in self._indexes(key):
+            self._bits[i >> 3] |= 1 << (i & 7)
+
+
+class WindowedBloomFilter:
+    """Keys added during the last `window` seconds (up to 2 x `window`)."""
+
+    def __init__(self, capacity: int, error_rate: float, window: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous: BloomFilter | None = None
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self._rotated_at >= self.window:
+            # the previous generation is too old after two windows
+            expired = now - self._rotated_at >= 2 * self.window
+            self._previous = None if expired else self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._rotated_at = now
+
+    def __contains__(self, key: str) -> bool:
+        self._rotate()
+        return key in self._current or (
+            self._previous is not None and key in self._previous
+        )
+
+    def add(self, key: str) -> None:
+        self._rotate()
+        self._current.add(key)
+
+
+class Deduplicator:
+    """Messages already handled by a service."""
+
+    def __init__(
+        self,
+        cache_size: int = 100_000,
+        capacity: int = 500_000,
+        error_rate: float = 1e-6,
+        window: float = 24 * 3600,
+        broker: Any = None,
+        bucket: str | None = None,
+    ):
+        self.window = window
+        self.broker = broker
+        self.bucket = bucket
+        self._recent = LRUCache(cache_size)
+        self._bloom = (
+            WindowedBloomFilter(capacity, error_rate, window)
+            if bucket is None
+            else None
+        )
+        self._kv = None
+        # duplicates dropped
+        self.dropped = 0
+
+    @classmethod
+    def from_settings(cls, settings, broker=None) -> "Deduplicator":
+        shared = settings.dedup_kv and settings.runtime != "monolith"
+        return cls(
+            cache_size=settings.dedup_cache_size,
+            capacity=settings.dedup_capacity,
+            error_rate=settings.dedup_error_rate,
+            window=settings.dedup_window,
+            broker=broker if shared else None,
+            bucket=settings.dedup_bucket if shared else None,
+        )
+
+    async def _bucket(self):
+        if self._kv is None:
+            self._kv = await self.broker.key_value(self.bucket, ttl=self.window)
+        return self._kv
+
+    @staticmethod
+    def _kv_key(key: str) -> str:
+        # any id is a valid KV key
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def seen(self, key: str) -> bool:
+        """True if `key` was already handled."""
+        if key in self._recent:
+            return True
+        if self._bloom is not None:
+            return key in self._bloom
+        # shared: other replicas may have handled it
+        try:
+            await (await self._bucket()).get(self._kv_key(key))
+        except KeyNotFoundError:
+            return False
+        return True
+
+    async def add(self, key: str) -> None:
+        """Record `key` as handled."""
+        self._recent.add(key)
+        if self._bloom is not None:
+            self._bloom.add(key)
+        else:
+            await (await self._bucket()).put(self._kv_key(key), b"")
+
+    async def drop(self, key: str | None) -> bool:
+        """True if the message `key` is a duplicate (None: unknown id)."""
+        if key is None or not await self.seen(key):
+            return False
+        self.dropped += 1
+        logger.info(f"duplicate message {key} dropped")
+        return True
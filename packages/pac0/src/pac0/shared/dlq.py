@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Dead-letter queue tool (JetStream runtime, see `pac0.shared.retry`).
+
+    # list the dead letters of a stage
+    python -m pac0.shared.dlq replay --stage routage --dry-run
+    # once the SMP is back: replay its timeouts on `routage-IN`
+    python -m pac0.shared.dlq replay --stage routage --code SMP_TIMEOUT
+
+Replayed messages restart with a fresh retry budget and are removed from
+the dead-letter stream; the others stay there.
+"""
+
+import argparse
+import asyncio
+import os
+
+import nats
+from nats.errors import TimeoutError
+
+from pac0.shared.dedup import MESSAGE_ID_HEADER
+from pac0.shared.esb import SettingsService
+from pac0.shared.retry import (
+    ATTEMPT_HEADER,
+    ERROR_CODE_HEADER,
+    ERROR_HEADER,
+    dlq_subject,
+)
+
+
+async def replay(
+    stage: str,
+    code: str | None = None,
+    limit: int = 0,
+    dry_run: bool = False,
+    batch: int = 100,
+) -> int:
+    """Replay the dead letters of `stage` (matching `code`), returns the count."""
+    settings = SettingsService()
+    nc = await nats.connect(os.environ.get("NATS_URL", "nats://localhost:4222"))
+    js = nc.jetstream()
+    # ephemeral consumer: the messages left unacked stay in the stream
+    sub = await js.pull_subscribe(dlq_subject(stage), stream=settings.dlq_stream)
+    count = 0
+    try:
+        while not limit or count < limit:
+            try:
+                msgs = await sub.fetch(batch, timeout=1)
+            except TimeoutError:
+                break
+            for msg in msgs:
+                headers = dict(msg.headers or {})
+                if code and headers.get(ERROR_CODE_HEADER) != code:
+                    continue
+                if limit and count >= limit:
+                    break
+                count += 1
+                print(
+                    f"{msg.metadata.sequence.stream}"
+                    f" {headers.get(ERROR_CODE_HEADER, '-')}"
+                    f" {headers.get(ERROR_HEADER, '')}"
+                )
+                if dry_run:
+                    continue
+                headers.pop(ERROR_CODE_HEADER, None)
+                headers.pop(ERROR_HEADER, None)
+                # a new message for the deduplication
+                headers.pop(MESSAGE_ID_HEADER, None)
+                headers[ATTEMPT_HEADER] = "0"
+                await js.publish(f"{stage}-IN", msg.data, headers=headers)
+                await msg.ack()
+            if msgs and msgs[-1].metadata.num_pending == 0:
+                break
+    finally:
+        await sub.unsubscribe()
+        await nc.close()
+    return count
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m pac0.shared.dlq")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser("replay", help="replay dead letters on <stage>-IN")
+    cmd.add_argument("--stage", required=True)
+    cmd.add_argument("--code", help="only this error code")
+    cmd.add_argument("--limit", type=int, default=0, help="0: no limit")
+    cmd.add_argument("--dry-run", action="store_true", help="list only")
+    args = parser.parse_args(argv)
+
+    count = asyncio.run(replay(args.stage, args.code, args.limit, args.dry_run))
+    print(f"{count} message(s) {'found' if args.dry_run else 'replayed'}")
+
+
+if __name__ == "__main__":
+    main()
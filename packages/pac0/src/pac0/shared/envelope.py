@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Compact binary envelope for the invoice messages crossing the ESB.
+
+Layout (network byte order):
+
+    magic    2 bytes  b"P0"
+    version  1 byte   VERSION
+    flags    1 byte   payload flags (FLAG_*)
+    count    1 byte   number of header fields
+    lengths  count x uint16, length of each header field
+    fields   count x utf-8 strings, in HEADER_FIELDS order
+    payload  remaining bytes, opaque (XML, PDF, ...)
+
+The payload is never parsed nor re-encoded: `decode()` returns a zero-copy
+`memoryview` on it. Header fields are positional: a decoder ignores the
+fields it does not know (newer producer) and leaves the missing ones
+empty (older producer), so the version only changes on layout breaks.
+"""
+
+from dataclasses import dataclass, replace
+import struct
+
+MAGIC = b"P0"
+VERSION = 1
+
+# payload flags
+FLAG_NONE = 0x00
+# the payload is a blob store key (see pac0.shared.blobstore)
+FLAG_CLAIM_CHECK = 0x01
+
+# header fields, append only !
+HEADER_FIELDS = (
+    "invoice_id",
+    "sender_siren",
+    "sender_siret",
+    "recipient_siren",
+    "recipient_siret",
+    "document_type",
+    "status",
+    # payload compression (see pac0.shared.compression)
+    "content_encoding",
+    # "high" or "low" (see pac0.shared.priority)
+    "priority",
+    # pipeline variant (see pac0.shared.pipeline)
+    "tenant",
+    # "local": recipient in the local directory, "remote": needs routage
+    "recipient_directory",
+    # choreography: next stages, comma separated (see CtxService.publish_out)
+    "routing_slip",
+    # client tracking id of the flow (see pac0.shared.flowstore)
+    "tracking_id",
+)
+
+_PREFIX = struct.Struct("!2sBBB")
+
+
+class EnvelopeError(ValueError):
+    """Invalid or unsupported envelope."""
+
+
+@dataclass(slots=True)
+class Envelope:
+    """Invoice message: routing metadata + opaque payload."""
+
+    invoice_id: str = ""
+    sender_siren: str = ""
+    sender_siret: str = ""
+    recipient_siren: str = ""
+    recipient_siret: str = ""
+    document_type: str = ""
+    status: str = ""
+    content_encoding: str = ""
+    priority: str = ""
+    tenant: str = ""
+    recipient_directory: str = ""
+    routing_slip: str = ""
+    tracking_id: str = ""
+    payload: bytes | memoryview = b""
+    flags: int = FLAG_NONE
+
+    def replace(self, **changes) -> "Envelope":
+        """Copy with some fields changed (the payload is shared, not copied)."""
+        return replace(self, **changes)
+
+
+def is_envelope(data) -> bool:
+    """True if `data` looks like an encoded envelope."""
+    return isinstance(data, (bytes, bytearray, memoryview)) and data[:2] == MAGIC
+
+
+def encode(envelope: Envelope) -> bytes:
+    """Encode an envelope to bytes."""
+    values = [getattr(envelope, name).encode() for name in HEADER_FIELDS]
+    count = len(values)
+    return b"".join(
+        (
+            _PREFIX.pack(MAGIC, VERSION, envelope.flags, count),
+            struct.pack(f"!{count}H", *map(len, values)),
+            *values,
+            envelope.payload,
+        )
+    )
+
+
+def decode(data: bytes | bytearray | memoryview) -> Envelope:
+    """Decode an envelope, the payload is a zero-copy view on `data`."""
+    view = memoryview(data)
+    try:
+        magic, version, flags, count = _PREFIX.unpack_from(view)
+    except struct.error as e:
+        raise EnvelopeError("truncated envelope") from e
+    if magic != MAGIC:
+        raise EnvelopeError("not an envelope")
+    if version != VERSION:
+        raise EnvelopeError(f"unsupported envelope version {version}")
+
+    offset = _PREFIX.size
+    try:
+        lengths = struct.unpack_from(f"!{count}H", view, offset)
+    except struct.error as e:
+        raise EnvelopeError("truncated envelope header") from e
+    offset += 2 * count
+
+    values = {}
+    for name, length in zip(HEADER_FIELDS, lengths):
+        values[name] = str(view[offset : offset + length], "utf-8")
+        offset += length
+    # skip unknown fields (newer producer)
+    offset += sum(lengths[len(HEADER_FIELDS) :])
+    if offset > len(view):
+        raise EnvelopeError("truncated envelope header")
+
+    return Envelope(**values, payload=view[offset:], flags=flags)
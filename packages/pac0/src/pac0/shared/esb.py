@@ -2,19 +2,415 @@
 #
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from dataclasses import dataclass
-from typing import Any
-from pydantic_settings import BaseSettings
-from faststream import FastStream, ContextRepo
+import asyncio
+from dataclasses import dataclass, field
+import functools
+import logging
+import types
+from typing import Any, Iterable
+import uuid
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from faststream import AckPolicy, FastStream, ContextRepo
 import os
-from faststream.nats import NatsBroker, NatsRouter
+from faststream.nats import ConsumerConfig, JStream, NatsBroker, NatsRouter, PullSub
+
+from pac0.shared import blobstore, flowstore, membus, metrics, retry
+from pac0.shared.dedup import MESSAGE_ID_HEADER, Deduplicator
+from pac0.shared.compression import Compressor
+from pac0.shared.backpressure import LOAD_SUBJECT
+from pac0.shared.envelope import Envelope, decode, encode, is_envelope
+from pac0.shared.pipeline import settings_pipelines
+from pac0.shared.sharding import ShardedPublisher, ShardManager, shard_subject
+from pac0.shared.priority import (
+    LOW_SUFFIX,
+    PRIORITY_HEADER,
+    Priority,
+    PriorityLimiter,
+    lane_subject,
+    parse_priority,
+)
 
 QUEUE = "q"
+# lifecycle events of the flows (choreography mode)
+LIFECYCLE_SUBJECT = "esb-lifecycle"
+
+logger = logging.getLogger(__name__)
 
 
 class SettingsService(BaseSettings):
-    # any_flag: bool
-    ...
+    """
+    Settings shared by every esb service.
+
+    Values are read from `PAC0_*` environment variables (or a `.env` file),
+    ex: `PAC0_JETSTREAM=1` to switch a service to JetStream durable mode.
+    """
+
+    model_config = SettingsConfigDict(
+        env_prefix="PAC0_",
+        env_file=".env",
+        extra="ignore",
+    )
+
+    # "nats": one process per brique over NATS (default)
+    # "monolith": every brique in one process over the in-memory bus
+    runtime: str = "nats"
+
+    # concurrency: handlers running at the same time in the service
+    # (all subscribers together), 0 for unbounded
+    max_inflight: int = 100
+    # concurrency: worker tasks per subscriber
+    workers: int = 1
+    # messages delivered but not yet handled (core NATS pending messages,
+    # JetStream max ack pending), 0 for the NATS default
+    prefetch: int = 0
+    # per service settings, by prefix, ex (JSON in `PAC0_SERVICE_OVERRIDES`):
+    # {"routage": {"workers": 32}, "controle-formats": {"max_inflight": 4}}
+    service_overrides: dict[str, dict[str, Any]] = {}
+
+    # priority lanes (see pac0.shared.priority): "<subject>" (high) and
+    # "<subject>-LOW" (low) subjects for every subscriber and publisher
+    priority_lanes: bool = True
+    # when both lanes wait for a slot: high priority handlers per low one
+    priority_high_weight: int = 4
+
+    # backpressure (see pac0.shared.backpressure): load report period (s)
+    load_report_interval: float = 1.0
+    # reports older than this (s) are ignored
+    load_stale_after: float = 5.0
+    # a stage is saturated at `high` x max_inflight handlers (running +
+    # waiting) and released under `low` x max_inflight
+    backpressure_high: float = 1.0
+    backpressure_low: float = 0.5
+    # max time (s) a hop waits for a saturated stage before forwarding
+    backpressure_max_wait: float = 30.0
+
+    # JetStream durable pipeline (opt-in, core NATS by default)
+    jetstream: bool = False
+    jetstream_stream: str = "PAC0"
+    # messages fetched per pull round-trip
+    jetstream_batch_size: int = 10
+    # max wait (seconds) for a batch to fill up
+    jetstream_batch_timeout: float = 5.0
+    # messages retention (seconds) in the stream, 0 for unlimited
+    jetstream_max_age: float = 7 * 24 * 3600
+
+    # batched publishing (see `BatchPublisher`)
+    publish_batch_size: int = 100
+    # max delay (seconds) a buffered message waits before being flushed
+    publish_batch_delay: float = 0.05
+
+    # claim-check: payloads above this size (bytes) go to the blob store
+    claim_check_threshold: int = 256 * 1024
+    # "local" (disk, see blob_store_dir) or "nats" (JetStream object store)
+    blob_store: str = "local"
+    blob_store_dir: str | None = None
+    blob_store_bucket: str = "pac0-payloads"
+
+    # payload compression: "auto" (zstd if installed, else gzip), "zstd",
+    # "gzip" or "none"
+    compression: str = "auto"
+    compression_level: int = 3
+    # payloads under this size (bytes) are sent as is
+    compression_min_size: int = 1024
+    # shared zstd dictionary file (see `compression.train_dictionary()`)
+    compression_dict: str | None = None
+
+    # gestion_cycle_vie pipeline definition (YAML, see pac0.shared.pipeline),
+    # default: the pipeline.yaml file of gestion_cycle_vie
+    pipeline_file: str | None = None
+    # choreography: briques publish directly to the next stage, from the
+    # envelope routing slip, instead of going through gestion_cycle_vie
+    choreography: bool = False
+
+    # retry of the failed messages (see pac0.shared.retry)
+    retry_max_attempts: int = 5
+    # backoff (s): uniform in [0, min(max_delay, base_delay x 2^attempt)]
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 300.0
+    # max redeliveries per second, 0 for unlimited
+    retry_rate: float = 50.0
+    retry_transient_errors: list[str] = sorted(retry.TRANSIENT_ERRORS)
+    # dead-letter stream (subjects `esb-dlq.>`), used in JetStream mode
+    dlq_stream: str = "PAC0-DLQ"
+
+    # drop the messages already handled (see pac0.shared.dedup)
+    dedup: bool = True
+    # exact cache of the last handled message ids
+    dedup_cache_size: int = 100_000
+    # Bloom filter: ids per window and false positive rate
+    dedup_capacity: int = 500_000
+    dedup_error_rate: float = 1e-6
+    dedup_window: float = 24 * 3600
+    # share the handled ids between replicas (NATS KV bucket)
+    dedup_kv: bool = False
+    dedup_bucket: str = "pac0-dedup"
+
+    # per SIREN ordering: shards of the `<stage>-IN` subjects (0: off),
+    # same value for every service (see pac0.shared.sharding)
+    shards: int = 0
+    shard_heartbeat: float = 5.0
+    # a replica without heartbeat for this long has left
+    shard_member_ttl: float = 15.0
+
+    # transmission_fiscale e-reporting batches (see its ereporting module)
+    # batch by SIREN and "day", "decade" or "month"
+    ereporting_period: str = "month"
+    ereporting_batch_size: int = 1000
+    ereporting_batch_bytes: int = 16 * 1024 * 1024
+    # max age of a batch (s)
+    ereporting_batch_window: float = 300.0
+    # buffered bytes kept in memory, the rest is spilled to disk
+    ereporting_memory_limit: int = 64 * 1024 * 1024
+    ereporting_spill_dir: str | None = None
+    # "local" (files in ereporting_dir) or "module:factory"
+    ereporting_transmitter: str = "local"
+    ereporting_dir: str | None = None
+
+    # flow lifecycle store (GET /flows/{flowId}): "auto" (local with the
+    # monolith runtime, nats otherwise), "nats" (JetStream key/value) or
+    # "local" (in process)
+    flow_store: str = "auto"
+    flow_store_bucket: str = "pac0-flows"
+    # revisions kept per flow (NATS, max 64)
+    flow_store_history: int = 64
+    # local store: append-only event log (JSON lines), replayed at startup
+    flow_store_file: str | None = None
+
+    # NATS connections (see `NatsPool`): connections shared by the services
+    # of the process (co-located briques), 0 for one connection per service
+    nats_pool_size: int = 1
+    # reconnection: delay (s) between attempts, attempts (-1 for unlimited)
+    nats_reconnect_time_wait: float = 2.0
+    nats_max_reconnect_attempts: int = 60
+    nats_connect_timeout: float = 2.0
+    nats_ping_interval: float = 120.0
+    nats_max_outstanding_pings: int = 2
+    # client buffers: bytes buffered while disconnected, pending flushes
+    nats_pending_size: int = 2 * 1024 * 1024
+    nats_flusher_queue_size: int = 1024
+
+    def for_service(self, prefix: str) -> "SettingsService":
+        """Settings with the overrides of the `prefix` service applied."""
+        overrides = self.service_overrides.get(prefix)
+        if not overrides:
+            return self
+        return self.model_validate({**self.model_dump(), **overrides})
+
+
+class NatsPool:
+    """
+    NATS connections shared by the services of the process.
+
+    Co-located services (briques imported in the same process) are spread
+    over `nats_pool_size` brokers instead of opening one connection each.
+    A pooled broker gets its routers and subscribers from every service
+    using it, and a single FastStream app runs it.
+    """
+
+    def __init__(self) -> None:
+        self._brokers: list[NatsBroker] = []
+        self._apps: dict[int, FastStream] = {}
+        self._assigned: dict[str, NatsBroker] = {}
+        # brokers created outside the pool (ex: api_gateway FastAPI router)
+        self._external: dict[str, NatsBroker] = {}
+
+    @staticmethod
+    def connection_kwargs(settings: SettingsService) -> dict[str, Any]:
+        """NATS client options (reconnect/backoff, buffers) from settings."""
+        return dict(
+            reconnect_time_wait=settings.nats_reconnect_time_wait,
+            max_reconnect_attempts=settings.nats_max_reconnect_attempts,
+            connect_timeout=settings.nats_connect_timeout,
+            ping_interval=settings.nats_ping_interval,
+            max_outstanding_pings=settings.nats_max_outstanding_pings,
+            pending_size=settings.nats_pending_size,
+            flusher_queue_size=settings.nats_flusher_queue_size,
+        )
+
+    def _new_broker(self, settings: SettingsService) -> NatsBroker:
+        _broker = NatsBroker(get_nats_url(), **self.connection_kwargs(settings))
+        # common esb features, once per connection
+        _broker.include_router(router)
+        return _broker
+
+    def broker(self, name: str, settings: SettingsService) -> NatsBroker:
+        """Broker for the `name` service (the same one on every call)."""
+        if name in self._assigned:
+            return self._assigned[name]
+        if settings.nats_pool_size <= 0:
+            _broker = self._new_broker(settings)
+        elif len(self._brokers) < settings.nats_pool_size:
+            _broker = self._new_broker(settings)
+            self._brokers.append(_broker)
+        else:
+            _broker = self._brokers[len(self._assigned) % len(self._brokers)]
+        self._assigned[name] = _broker
+        return _broker
+
+    def app(self, _broker: NatsBroker) -> FastStream:
+        """The FastStream app running `_broker`."""
+        if id(_broker) not in self._apps:
+            self._apps[id(_broker)] = FastStream(_broker)
+        return self._apps[id(_broker)]
+
+    def register(self, name: str, _broker: NatsBroker) -> None:
+        """Follow a broker created outside the pool (stats only)."""
+        self._external[name] = _broker
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Connection stats (nats-py client counters)."""
+        by_broker: dict[int, tuple[NatsBroker, list[str]]] = {}
+        for name, _broker in [*self._assigned.items(), *self._external.items()]:
+            by_broker.setdefault(id(_broker), (_broker, []))[1].append(name)
+
+        result = []
+        for _broker, names in by_broker.values():
+            client = _broker._connection
+            stat: dict[str, Any] = {"services": names, "connected": False}
+            if client is not None:
+                url = client.connected_url
+                stat.update(
+                    connected=client.is_connected,
+                    url=url.geturl() if url else None,
+                    pending_bytes=client.pending_data_size,
+                    **client.stats,
+                )
+            result.append(stat)
+        return result
+
+    def clear(self) -> None:
+        """Forget every broker (tests)."""
+        self._brokers.clear()
+        self._apps.clear()
+        self._assigned.clear()
+        self._external.clear()
+
+
+def current_message(broker) -> Any:
+    """Message being handled (faststream or in-memory bus), or None."""
+    message = membus.current_message.get()
+    if message is None and isinstance(broker, NatsBroker):
+        message = broker.context.get_local("message")
+    return message
+
+
+def message_priority(broker) -> Priority:
+    """Priority of the message being handled (high by default)."""
+    message = current_message(broker)
+    if message is None or not message.headers:
+        return Priority.HIGH
+    return parse_priority(message.headers.get(PRIORITY_HEADER))
+
+
+class LanePublisher:
+    """
+    Publisher on the high and low priority lanes of a subject.
+
+    The lane is, in order: the `priority` argument, the `priority` field of
+    an envelope message, the priority of the message being handled.
+    Other attributes are the ones of the high lane publisher.
+
+    Every message gets the hop timestamps headers (see pac0.shared.metrics)
+    and a unique message id, unless given in `headers` (see
+    pac0.shared.dedup).
+    """
+
+    def __init__(self, broker, high, low=None):
+        self.broker = broker
+        self.high = high
+        self.low = low
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.high, name)
+
+    async def publish(
+        self,
+        message: Any,
+        priority: Priority | str | None = None,
+        headers: dict[str, str] | None = None,
+        **kwargs,
+    ) -> Any:
+        if priority is None and is_envelope(message):
+            priority = decode(message).priority or None
+        if priority is None:
+            priority = message_priority(self.broker)
+        priority = parse_priority(priority)
+        headers = {
+            MESSAGE_ID_HEADER: uuid.uuid4().hex,
+            **metrics.hop_headers(),
+            **(headers or {}),
+            PRIORITY_HEADER: str(priority),
+        }
+        publisher = self.high
+        if priority == Priority.LOW and self.low is not None:
+            publisher = self.low
+        return await publisher.publish(message, headers=headers, **kwargs)
+
+
+def lane_publisher(broker, subject: str, settings: SettingsService, **kwargs):
+    """Publisher for `subject`, on both priority lanes if enabled."""
+    high = broker.publisher(subject, **kwargs)
+    low = None
+    if settings.priority_lanes:
+        low = broker.publisher(lane_subject(subject, Priority.LOW), **kwargs)
+    return LanePublisher(broker, high, low)
+
+
+class BatchPublisher:
+    """
+    Buffered publisher: messages are accumulated then sent together.
+
+    The buffer is flushed when it reaches `max_size` messages or `max_delay`
+    seconds after the first buffered message, whichever comes first.
+    A flush sends the whole buffer concurrently, so core NATS writes are
+    coalesced in a single socket flush and JetStream acks are pipelined.
+    """
+
+    def __init__(self, publisher, max_size: int = 100, max_delay: float = 0.05):
+        self.publisher = publisher
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._buffer: list[tuple[Any, dict[str, Any]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushing: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def publish(self, message: Any, **kwargs) -> None:
+        """Buffer a message (same arguments as `publisher.publish`)."""
+        self._buffer.append((message, kwargs))
+        if len(self._buffer) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.max_delay, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        task = asyncio.create_task(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task: asyncio.Task) -> None:
+        self._flushing.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("batch flush failed", exc_info=task.exception())
+
+    async def flush(self) -> None:
+        """Send all the buffered messages now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        buffer, self._buffer = self._buffer, []
+        if buffer:
+            await asyncio.gather(
+                *(self.publisher.publish(m, **kwargs) for m, kwargs in buffer)
+            )
+        # wait for timer triggered flushes still in progress
+        pending = self._flushing - {asyncio.current_task()}
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
 
 
 @dataclass
@@ -27,15 +423,504 @@ class CtxService:
     subject_err: str
     publisher_out: Any
     publisher_err: Any
+    settings: SettingsService = field(default_factory=SettingsService)
+    stream: JStream | None = None
+    batch_publishers: list[BatchPublisher] = field(default_factory=list)
+    blob_store: Any = None
+    compressor: Compressor | None = None
+    # choreography: publisher on `<stage>-IN` for every stage
+    next_publishers: dict[str, Any] = field(default_factory=dict)
+    lifecycle: BatchPublisher | None = None
+    # coroutines run when the service stops
+    shutdown_hooks: list[Any] = field(default_factory=list)
+    # coroutines run by `flush` (ex: buffers of a brique)
+    flush_hooks: list[Any] = field(default_factory=list)
+    deduplicator: Deduplicator | None = None
+    # sharded `subject_in`: shards of this replica (None: every shard)
+    shard_manager: ShardManager | None = None
+    # handlers currently running
+    inflight: int = 0
+    # handlers running or waiting for a free slot
+    queued: int = 0
+
+    def __post_init__(self):
+        self._inflight_limit = (
+            PriorityLimiter(
+                self.settings.max_inflight, self.settings.priority_high_weight
+            )
+            if self.settings.max_inflight > 0
+            else None
+        )
+        self._load_report: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+        # sharded `subject_in`: handler and subscribers, by shard
+        self._shard_handlers: list[Any] = []
+        self._shard_kwargs: dict[str, Any] = {}
+        self._shard_subscribers: dict[int, list[Any]] = {}
+        if self.compressor is None:
+            self.compressor = Compressor.from_settings(self.settings)
+        if self.deduplicator is None and self.settings.dedup:
+            self.deduplicator = Deduplicator.from_settings(self.settings, self.broker)
+
+    def subscriber(self, subject: str | None = None, **kwargs):
+        """
+        Subscriber decorator for `subject` (default: `subject_in`).
+
+        Core NATS: queue group subscriber.
+        JetStream: durable pull consumer with batch fetch and explicit acks
+        (the message is acked after the handler, nacked on error).
+
+        Concurrency is bounded by the `workers`, `prefetch` and
+        `max_inflight` settings.
+
+        With priority lanes, the handler also subscribes to the low
+        priority lane (`<subject>-LOW`).
+
+        With shards, `subject_in` handlers subscribe to the shards of the
+        replica instead (see `pac0.shared.sharding`).
+        """
+        subject = subject or self.subject_in
+        if self.settings.shards and subject == self.subject_in:
+            return self._sharded_subscriber(**kwargs)
+        decorators = [self._subscriber(subject, **kwargs)]
+        if self.settings.priority_lanes and not subject.endswith(LOW_SUFFIX):
+            low = lane_subject(subject, Priority.LOW)
+            decorators.append(self._subscriber(low, **kwargs))
+
+        def wrapper(func):
+            # one handler for every lane (like stacked subscribers)
+            handler = self._limited(func)
+            for decorator in decorators:
+                handler = decorator(handler)
+            return handler
+
+        return wrapper
+
+    def _sharded_subscriber(self, **kwargs):
+        def wrapper(func):
+            handler = self._limited(func)
+
+            def ordered(shard: int):
+                # messages of a shard are handled one at a time, in order
+                lock = asyncio.Lock()
+
+                @functools.wraps(handler)
+                async def process(*args, **kw):
+                    async with lock:
+                        return await handler(*args, **kw)
+
+                return process
+
+            self._shard_kwargs = kwargs
+            self._shard_handlers = [ordered(s) for s in range(self.settings.shards)]
+            if self.shard_manager is None:
+                # single replica (monolith): every shard
+                for shard in range(self.settings.shards):
+                    self._subscribe_shard(shard)
+            return func
+
+        return wrapper
 
+    def _subscribe_shard(self, shard: int) -> list[Any]:
+        subject = shard_subject(self.subject_in, shard)
+        subjects = [subject]
+        if self.settings.priority_lanes:
+            subjects.append(lane_subject(subject, Priority.LOW))
+        handler = self._shard_handlers[shard]
+        subscribers = []
+        for subject in subjects:
+            subscriber = self._subscriber(
+                subject, persistent=False, **self._shard_kwargs
+            )
+            subscriber(handler)
+            subscribers.append(subscriber)
+        self._shard_subscribers[shard] = subscribers
+        return subscribers
 
-def init_esb_app(prefix):
+    async def subscribe_shard(self, shard: int) -> None:
+        """Start handling `shard` (rebalance)."""
+        for subscriber in self._subscribe_shard(shard):
+            await subscriber.start()
+
+    async def unsubscribe_shard(self, shard: int) -> None:
+        """Stop handling `shard`, after its messages in flight (rebalance)."""
+        for subscriber in self._shard_subscribers.pop(shard, []):
+            await subscriber.stop()
+
+    async def start_sharding(self) -> None:
+        if (
+            self.shard_manager is not None
+            and self._shard_handlers
+            and self._heartbeat is None
+        ):
+            await self.shard_manager.rebalance()
+            self._heartbeat = asyncio.create_task(self.shard_heartbeat())
+
+    async def stop_sharding(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+            report = {**self.shard_manager.heartbeat(), "leaving": True}
+            await self.broker.publish(report, f"{self.prefix}-SHARDS")
+            await self.shard_manager.release()
+
+    async def shard_heartbeat(self) -> None:
+        """Announce this replica to the other ones, forget the silent ones."""
+        while True:
+            try:
+                await self.broker.publish(
+                    self.shard_manager.heartbeat(), f"{self.prefix}-SHARDS"
+                )
+                await self.shard_manager.expire()
+            except Exception:
+                logger.exception("shard heartbeat failed")
+            await asyncio.sleep(self.settings.shard_heartbeat)
+
+    def _subscriber(self, subject: str, **kwargs):
+        settings = self.settings
+        kwargs.setdefault("max_workers", settings.workers)
+        if self.stream is None:
+            if settings.prefetch:
+                kwargs.setdefault("pending_msgs_limit", settings.prefetch)
+            decorator = self.broker.subscriber(subject, self.queue, **kwargs)
+        else:
+            if settings.prefetch:
+                kwargs.setdefault(
+                    "config", ConsumerConfig(max_ack_pending=settings.prefetch)
+                )
+            decorator = self.broker.subscriber(
+                subject,
+                stream=self.stream,
+                durable=durable_name(subject),
+                pull_sub=PullSub(
+                    batch_size=settings.jetstream_batch_size,
+                    timeout=settings.jetstream_batch_timeout,
+                ),
+                ack_policy=AckPolicy.NACK_ON_ERROR,
+                **kwargs,
+            )
+        return decorator
+
+    def _limited(self, func):
+        """Wrap a handler to count (and bound) the handlers in flight."""
+        # stacked subscribers: the handler is already wrapped
+        if not isinstance(func, types.FunctionType) or getattr(
+            func, "__pac0_limited__", False
+        ):
+            return func
+
+        @functools.wraps(func)
+        async def handler(*args, **kwargs):
+            key = self.message_key()
+            if key is not None and await self.deduplicator.drop(key):
+                return None
+            self.queued += 1
+            try:
+                if self._inflight_limit is None:
+                    result = await self._run(func, args, kwargs)
+                else:
+                    async with self._inflight_limit.slot(self.priority()):
+                        result = await self._run(func, args, kwargs)
+            finally:
+                self.queued -= 1
+            # handled: a redelivery is a duplicate now
+            if key is not None:
+                await self.deduplicator.add(key)
+            return result
+
+        handler.__pac0_limited__ = True
+        return handler
+
+    async def _run(self, func, args, kwargs):
+        self.inflight += 1
+        hop = metrics.start_hop(self.prefix, self.message_headers())
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.current_hop.reset(hop)
+            self.inflight -= 1
+
+    def stats(self) -> dict[str, Any]:
+        """Load of the service."""
+        return {
+            "service": self.prefix,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_inflight": self.settings.max_inflight,
+            "workers": self.settings.workers,
+            "prefetch": self.settings.prefetch,
+            "duplicates": (
+                self.deduplicator.dropped if self.deduplicator else 0
+            ),
+            "waiting": (
+                self._inflight_limit.waiting() if self._inflight_limit else {}
+            ),
+        }
+
+    def correlation_id(self) -> str | None:
+        """Correlation id of the message being handled."""
+        message = current_message(self.broker)
+        return message.correlation_id if message is not None else None
+
+    def message_key(self) -> str | None:
+        """Deduplication key of the message being handled (None: no dedup)."""
+        if self.deduplicator is None:
+            return None
+        message = current_message(self.broker)
+        if message is None or not message.headers:
+            return None
+        message_id = message.headers.get(MESSAGE_ID_HEADER)
+        return f"{self.prefix}:{message_id}" if message_id else None
+
+    def message_headers(self) -> dict[str, str]:
+        """Headers of the message being handled."""
+        message = current_message(self.broker)
+        return dict(message.headers or {}) if message is not None else {}
+
+    def priority(self) -> Priority:
+        """Priority of the message being handled."""
+        return message_priority(self.broker)
+
+    def publisher(self, subject: str, **kwargs):
+        """
+        Publisher for `subject`.
+
+        With shards, a `<stage>-IN` publisher publishes each message on
+        the shard of its SIREN (see `pac0.shared.sharding`).
+
+        JetStream: the subject is bound to the stream and every publish
+        waits for the stream acknowledgement.
+        With priority lanes, the message keeps the priority of the message
+        being handled (see `LanePublisher`).
+        """
+        if self.settings.shards and subject.endswith("-IN"):
+            return ShardedPublisher(
+                subject,
+                [
+                    lane_publisher(
+                        self.broker,
+                        shard_subject(subject, shard),
+                        self.settings,
+                        stream=self.stream,
+                        **kwargs,
+                    )
+                    for shard in range(self.settings.shards)
+                ],
+            )
+        return lane_publisher(
+            self.broker, subject, self.settings, stream=self.stream, **kwargs
+        )
+
+    async def publish_out(self, message: Any, **kwargs) -> None:
+        """
+        Publish the result of the service.
+
+        Choreography: an envelope with a routing slip goes directly to the
+        next stage of the slip and a lifecycle event is emitted. Otherwise
+        (or at the end of the slip) the message goes to `publisher_out`.
+        """
+        kwargs.setdefault("correlation_id", self.correlation_id())
+        if self.next_publishers and is_envelope(message):
+            envelope = decode(message)
+            if envelope.routing_slip:
+                stage, _, rest = envelope.routing_slip.partition(",")
+                publisher = self.next_publishers.get(stage)
+                if publisher is not None:
+                    message = encode(envelope.replace(routing_slip=rest))
+                    await publisher.publish(message, **kwargs)
+                    await self.lifecycle.publish(
+                        {
+                            "invoice_id": envelope.invoice_id,
+                            "correlation_id": kwargs["correlation_id"],
+                            "tracking_id": envelope.tracking_id,
+                            "sirens": [
+                                s
+                                for s in (
+                                    envelope.sender_siren,
+                                    envelope.recipient_siren,
+                                )
+                                if s
+                            ],
+                            "stage": self.prefix,
+                            "next": stage,
+                            "hop": metrics.hop_headers(),
+                        }
+                    )
+                    return
+                logger.warning(f"{self.prefix}: unknown stage {stage!r} in slip")
+        await self.publisher_out.publish(message, **kwargs)
+
+    async def publish_err(
+        self, message: Any, code: str, error: str = "", **kwargs
+    ) -> None:
+        """
+        Report a failed message on `publisher_err` (retried by
+        gestion_cycle_vie if `code` is a transient error).
+        """
+        kwargs.setdefault("correlation_id", self.correlation_id())
+        incoming = self.message_headers()
+        headers = {
+            **kwargs.pop("headers", {}),
+            retry.ERROR_CODE_HEADER: code,
+            retry.ERROR_HEADER: error,
+            retry.ATTEMPT_HEADER: incoming.get(retry.ATTEMPT_HEADER, "0"),
+        }
+        await self.publisher_err.publish(message, headers=headers, **kwargs)
+
+    async def publish_many(
+        self,
+        messages: Iterable[Any],
+        publisher=None,
+        correlation_id: str | None = None,
+    ) -> None:
+        """
+        Publish several messages in one go (default on `publisher_out`).
+
+        Messages are sent by chunks of `publish_batch_size`, each chunk being
+        published concurrently (single socket flush / pipelined acks).
+        """
+        batch = BatchPublisher(
+            publisher or self.publisher_out,
+            max_size=self.settings.publish_batch_size,
+        )
+        for message in messages:
+            await batch.publish(message, correlation_id=correlation_id)
+        await batch.flush()
+
+    def batch_publisher(self, subject: str | None = None) -> BatchPublisher:
+        """
+        Auto-flushing buffered publisher (default on `subject_out`).
+
+        Buffered messages are flushed on size/delay thresholds (settings
+        `publish_batch_size` and `publish_batch_delay`), or with `flush()`.
+        """
+        publisher = self.publisher(subject) if subject else self.publisher_out
+        batch = BatchPublisher(
+            publisher,
+            max_size=self.settings.publish_batch_size,
+            max_delay=self.settings.publish_batch_delay,
+        )
+        self.batch_publishers.append(batch)
+        return batch
+
+    async def report_load(self) -> None:
+        """Publish the service load on `LOAD_SUBJECT`, periodically."""
+        while True:
+            try:
+                await self.broker.publish(self.stats(), LOAD_SUBJECT)
+            except Exception:
+                logger.warning("load report failed", exc_info=True)
+            await asyncio.sleep(self.settings.load_report_interval)
+
+    async def start_load_report(self) -> None:
+        if self._load_report is None:
+            self._load_report = asyncio.create_task(self.report_load())
+
+    async def stop_load_report(self) -> None:
+        if self._load_report is not None:
+            self._load_report.cancel()
+            self._load_report = None
+
+    async def shutdown(self) -> None:
+        """Run the shutdown hooks."""
+        for hook in self.shutdown_hooks:
+            await hook()
+
+    async def flush(self) -> None:
+        """Flush the buffers, then every batch publisher of the service."""
+        for hook in self.flush_hooks:
+            await hook()
+        await asyncio.gather(*(b.flush() for b in self.batch_publishers))
+
+    async def check_in(self, envelope: Envelope) -> Envelope:
+        """
+        Prepare an envelope for publishing: compress the payload, then
+        claim-check it if it is still too large.
+        """
+        if not envelope.content_encoding and not envelope.flags:
+            payload, encoding = self.compressor.compress(envelope.payload)
+            if encoding:
+                envelope = envelope.replace(
+                    payload=payload, content_encoding=encoding
+                )
+        return await blobstore.check_in(
+            envelope, self.blob_store, self.settings.claim_check_threshold
+        )
+
+    async def check_out(self, envelope: Envelope) -> bytes | memoryview:
+        """
+        Envelope payload, fetched from the blob store and decompressed only
+        when a brique needs it.
+        """
+        payload = await blobstore.check_out(envelope, self.blob_store)
+        return self.compressor.decompress(payload, envelope.content_encoding)
+
+
+def get_blob_store(settings: SettingsService, broker) -> blobstore.BlobStore:
+    """Blob store configured by the settings."""
+    if settings.blob_store == "nats":
+        return blobstore.NatsBlobStore(broker, settings.blob_store_bucket)
+    if settings.blob_store == "local":
+        return blobstore.LocalBlobStore(settings.blob_store_dir)
+    raise ValueError(f"unknown blob store {settings.blob_store!r}")
+
+
+def init_choreography(ctx: CtxService) -> None:
+    """Publishers to every stage of the pipelines (see `publish_out`)."""
+    ctx.next_publishers = {
+        stage: ctx.publisher(f"{stage}-IN")
+        for stage in settings_pipelines(ctx.settings).targets
+    }
+    ctx.lifecycle = ctx.batch_publisher(LIFECYCLE_SUBJECT)
+
+
+_local_flow_store: flowstore.LocalFlowStore | None = None
+
+
+def get_flow_store(settings: SettingsService, broker) -> flowstore.FlowStore:
+    """Flow lifecycle store configured by the settings."""
+    global _local_flow_store
+
+    kind = settings.flow_store
+    if kind == "auto":
+        kind = "local" if settings.runtime == "monolith" else "nats"
+    if kind == "nats":
+        return flowstore.NatsFlowStore(
+            broker, settings.flow_store_bucket, settings.flow_store_history
+        )
+    if kind == "local":
+        # shared by the services of the process
+        if _local_flow_store is None:
+            _local_flow_store = flowstore.LocalFlowStore(settings.flow_store_file)
+        return _local_flow_store
+    raise ValueError(f"unknown flow store {settings.flow_store!r}")
+
+
+def durable_name(subject: str) -> str:
+    """JetStream durable consumer name for a subject (one per subject)."""
+    return subject.replace(".", "_").replace("*", "ALL").replace(">", "ALL")
+
+
+# every service initialized in this process
+services: list[CtxService] = []
+
+
+def init_esb_app(prefix, settings: SettingsService | None = None):
+    """
+    Initialize an esb service (brique).
+
+    With the "monolith" runtime, every brique shares the in-memory bus
+    and no FastStream app is returned (see `pac0.shared.monolith`).
+    """
     global broker
 
-    _broker = NatsBroker(get_nats_url())
+    settings = (settings or SettingsService()).for_service(prefix)
+
+    if settings.runtime == "monolith":
+        return init_esb_app_monolith(prefix, settings)
 
-    app = FastStream(_broker)
-    _broker.include_router(router)
+    _broker = nats_pool.broker(prefix, settings)
+    app = nats_pool.app(_broker)
 
     broker = _broker
 
@@ -43,6 +928,13 @@ def init_esb_app(prefix):
     subject_out = f"{prefix}-OUT"
     subject_err = f"{prefix}-ERR"
 
+    stream = None
+    if settings.jetstream:
+        stream = JStream(
+            settings.jetstream_stream,
+            max_age=settings.jetstream_max_age or None,
+        )
+
     ctx = CtxService(
         prefix=prefix,
         queue=QUEUE,
@@ -50,21 +942,84 @@ def init_esb_app(prefix):
         subject_in=subject_in,
         subject_out=subject_out,
         subject_err=subject_err,
-        publisher_out=_broker.publisher(subject_out),
-        publisher_err=_broker.publisher(subject_err),
+        publisher_out=lane_publisher(_broker, subject_out, settings, stream=stream),
+        publisher_err=lane_publisher(_broker, subject_err, settings, stream=stream),
+        settings=settings,
+        stream=stream,
+        blob_store=get_blob_store(settings, _broker),
     )
 
+    services.append(ctx)
+    if settings.choreography:
+        init_choreography(ctx)
+
+    if settings.shards:
+        ctx.shard_manager = ShardManager(
+            settings.shards,
+            ctx.subscribe_shard,
+            ctx.unsubscribe_shard,
+            ttl=settings.shard_member_ttl,
+        )
+
+        # replicas of the service (broadcast)
+        @_broker.subscriber(f"{prefix}-SHARDS")
+        async def shards_sub(report: dict[str, Any]):
+            await ctx.shard_manager.update(report)
+
+    # service load, on request (ex: `nats req controle-formats-STATS ""`)
+    @_broker.subscriber(f"{prefix}-STATS")
+    async def stats_sub() -> dict[str, Any]:
+        return {**ctx.stats(), "connections": nats_pool.stats()}
+
+    app.after_startup(ctx.start_load_report)
+    app.after_startup(ctx.start_sharding)
+    app.on_shutdown(ctx.stop_load_report)
+    app.on_shutdown(ctx.stop_sharding)
+    app.on_shutdown(ctx.shutdown)
+    # do not lose buffered messages on shutdown
+    app.on_shutdown(ctx.flush)
+
     # You MUST return broker and app separatly
     return ctx, _broker, app
 
 
+def init_esb_app_monolith(prefix, settings: SettingsService):
+    """esb service on the in-memory bus (single process runtime)."""
+    bus = membus.bus
+
+    subject_out = f"{prefix}-OUT"
+    subject_err = f"{prefix}-ERR"
+
+    ctx = CtxService(
+        prefix=prefix,
+        queue=QUEUE,
+        broker=bus,
+        subject_in=f"{prefix}-IN",
+        subject_out=subject_out,
+        subject_err=subject_err,
+        publisher_out=lane_publisher(bus, subject_out, settings),
+        publisher_err=lane_publisher(bus, subject_err, settings),
+        settings=settings,
+        blob_store=blobstore.LocalBlobStore(settings.blob_store_dir),
+    )
+    services.append(ctx)
+    if settings.choreography:
+        init_choreography(ctx)
+
+    @bus.subscriber("healthcheck")
+    async def healthcheck(message):
+        await bus.publish("I am alive !", "healthcheck_resp")
+
+    return ctx, bus, None
+
+
 # TODO: deprecate
 def init_esb_app_old():
     # TODO: use router to allow dynamic router setup
     # broker.include_router(router)
     # broker = NatsBroker("nats://demo.nats.io:4222")
-    broker = NatsBroker("nats://localhost:4222")
-    app = FastStream(broker)
+    broker = nats_pool.broker("old", SettingsService())
+    app = nats_pool.app(broker)
     publisher_ping = broker.publisher("pong")
     publisher_pong = broker.publisher("pong")
 
@@ -96,6 +1051,9 @@ router = NatsRouter(prefix="")
 
 broker = None
 
+# NATS connections of the process
+nats_pool = NatsPool()
+
 
 @router.subscriber("healthcheck")
 async def healthcheck_sub(
@@ -0,0 +1,263 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Lifecycle state of the flows (`GET /flows/{flowId}`).
+
+gestion_cycle_vie records a `FlowEvent` at every hop. The store keeps:
+* the current `FlowState` of every flow, by flow id (correlation id)
+* an index by tracking id and by SIREN (sender and recipient)
+* the history of the states of a flow (append only)
+
+Every query is a key lookup, never a scan of the messages, and reads never
+touch the pipeline.
+
+Stores:
+* `LocalFlowStore`: in process, with an optional append-only JSON lines
+  event log replayed at startup (monolith runtime)
+* `NatsFlowStore`: NATS JetStream key/value bucket, shared by the
+  services; the history of a flow is the history of its key
+"""
+
+import asyncio
+import base64
+from pathlib import Path
+import time
+from typing import Any, Protocol
+
+from nats.js.errors import (
+    KeyNotFoundError,
+    KeyWrongLastSequenceError,
+    NoKeysError,
+)
+from pydantic import BaseModel, Field
+
+from pac0.shared.envelope import Envelope
+
+# flow status
+IN_PROGRESS = "in_progress"
+DONE = "done"
+ERROR = "error"
+
+
+class FlowEvent(BaseModel):
+    """A flow reached a stage."""
+
+    flow_id: str
+    stage: str
+    status: str = IN_PROGRESS
+    tracking_id: str = ""
+    sirens: list[str] = []
+    at: float = Field(default_factory=time.time)
+
+    @classmethod
+    def from_envelope(
+        cls, flow_id: str, stage: str, envelope: Envelope | None, **kwargs
+    ) -> "FlowEvent":
+        if envelope is None:
+            return cls(flow_id=flow_id, stage=stage, **kwargs)
+        sirens = [s for s in (envelope.sender_siren, envelope.recipient_siren) if s]
+        return cls(
+            flow_id=flow_id,
+            stage=stage,
+            tracking_id=envelope.tracking_id,
+            sirens=sirens,
+            **kwargs,
+        )
+
+
+class FlowState(BaseModel):
+    """Current state of a flow."""
+
+    flow_id: str
+    stage: str
+    status: str
+    tracking_id: str = ""
+    sirens: list[str] = []
+    created_at: float
+    updated_at: float
+    events: int = 1
+
+
+def apply(state: FlowState | None, event: FlowEvent) -> FlowState:
+    """New state of a flow after `event` (late events only add up)."""
+    if state is None:
+        return FlowState(
+            flow_id=event.flow_id,
+            stage=event.stage,
+            status=event.status,
+            tracking_id=event.tracking_id,
+            sirens=event.sirens,
+            created_at=event.at,
+            updated_at=event.at,
+        )
+    changes: dict[str, Any] = {
+        "events": state.events + 1,
+        "tracking_id": state.tracking_id or event.tracking_id,
+        "sirens": list(dict.fromkeys([*state.sirens, *event.sirens])),
+    }
+    if event.at >= state.updated_at:
+        changes.update(stage=event.stage, status=event.status, updated_at=event.at)
+    return state.model_copy(update=changes)
+
+
+class FlowStore(Protocol):
+    """Flow lifecycle store."""
+
+    async def append(self, event: FlowEvent) -> FlowState: ...
+
+    async def get(self, flow_id: str) -> FlowState | None: ...
+
+    async def by_tracking_id(self, tracking_id: str) -> FlowState | None: ...
+
+    async def by_siren(self, siren: str) -> list[FlowState]: ...
+
+    async def history(self, flow_id: str) -> list[FlowState]: ...
+
+
+class LocalFlowStore:
+    """Flow store in process memory."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._history: dict[str, list[FlowState]] = {}
+        self._tracking: dict[str, str] = {}
+        # SIREN -> flow ids (ordered set)
+        self._sirens: dict[str, dict[str, None]] = {}
+        if self.path is not None and self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    self._apply(FlowEvent.model_validate_json(line))
+
+    def _apply(self, event: FlowEvent) -> FlowState:
+        history = self._history.setdefault(event.flow_id, [])
+        state = apply(history[-1] if history else None, event)
+        history.append(state)
+        if state.tracking_id:
+            self._tracking[state.tracking_id] = state.flow_id
+        for siren in event.sirens:
+            self._sirens.setdefault(siren, {})[state.flow_id] = None
+        return state
+
+    async def append(self, event: FlowEvent) -> FlowState:
+        if self.path is not None:
+            line = event.model_dump_json() + "\n"
+            await asyncio.to_thread(self._write, line)
+        return self._apply(event)
+
+    def _write(self, line: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(line)
+
+    async def get(self, flow_id: str) -> FlowState | None:
+        history = self._history.get(flow_id)
+        return history[-1] if history else None
+
+    async def by_tracking_id(self, tracking_id: str) -> FlowState | None:
+        flow_id = self._tracking.get(tracking_id)
+        return await self.get(flow_id) if flow_id else None
+
+    async def by_siren(self, siren: str) -> list[FlowState]:
+        return [self._history[f][-1] for f in self._sirens.get(siren, ())]
+
+    async def history(self, flow_id: str) -> list[FlowState]:
+        return list(self._history.get(flow_id, ()))
+
+
+def _key(value: str) -> str:
+    """KV key token for any string (ids may contain invalid characters)."""
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+class NatsFlowStore:
+    """
+    Flow store on a NATS JetStream key/value bucket.
+
+    Keys: `flow.<id>` (state, history = revisions), `tracking.<id>` (flow
+    id) and `siren.<siren>.<flow id>` (index entry).
+    """
+
+    def __init__(self, broker: Any, bucket: str = "pac0-flows", history: int = 64):
+        self.broker = broker
+        self.bucket = bucket
+        self.history_size = min(history, 64)
+        self._kv = None
+
+    async def _bucket(self):
+        if self._kv is None:
+            self._kv = await self.broker.key_value(
+                self.bucket, history=self.history_size
+            )
+        return self._kv
+
+    async def _state(self, kv, key: str) -> tuple[FlowState | None, int | None]:
+        try:
+            entry = await kv.get(key)
+        except KeyNotFoundError:
+            return None, None
+        return FlowState.model_validate_json(entry.value), entry.revision
+
+    async def append(self, event: FlowEvent) -> FlowState:
+        kv = await self._bucket()
+        key = f"flow.{_key(event.flow_id)}"
+        # optimistic concurrency: events of a flow may arrive together
+        while True:
+            state, revision = await self._state(kv, key)
+            new = apply(state, event)
+            value = new.model_dump_json().encode()
+            try:
+                if revision is None:
+                    await kv.create(key, value)
+                else:
+                    await kv.update(key, value, last=revision)
+                break
+            except KeyWrongLastSequenceError:
+                continue
+
+        if new.tracking_id and (state is None or not state.tracking_id):
+            await kv.put(f"tracking.{_key(new.tracking_id)}", event.flow_id.encode())
+        for siren in event.sirens:
+            if state is None or siren not in state.sirens:
+                await kv.put(f"siren.{_key(siren)}.{_key(event.flow_id)}", b"")
+        return new
+
+    async def get(self, flow_id: str) -> FlowState | None:
+        kv = await self._bucket()
+        return (await self._state(kv, f"flow.{_key(flow_id)}"))[0]
+
+    async def by_tracking_id(self, tracking_id: str) -> FlowState | None:
+        kv = await self._bucket()
+        try:
+            entry = await kv.get(f"tracking.{_key(tracking_id)}")
+        except KeyNotFoundError:
+            return None
+        return await self.get(entry.value.decode())
+
+    async def by_siren(self, siren: str) -> list[FlowState]:
+        kv = await self._bucket()
+        # the server filters the index keys of this SIREN only
+        watcher = await kv.watch(
+            f"siren.{_key(siren)}.*", meta_only=True, ignore_deletes=True
+        )
+        keys = []
+        async for entry in watcher:
+            if entry is None:
+                break
+            keys.append(entry.key)
+        await watcher.stop()
+
+        states = []
+        for key in keys:
+            state, _ = await self._state(kv, f"flow.{key.rsplit('.', 1)[1]}")
+            if state is not None:
+                states.append(state)
+        return states
+
+    async def history(self, flow_id: str) -> list[FlowState]:
+        kv = await self._bucket()
+        try:
+            entries = await kv.history(f"flow.{_key(flow_id)}")
+        except NoKeysError:
+            return []
+        return [FlowState.model_validate_json(e.value) for e in entries if e.value]
@@ -0,0 +1,150 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+In-memory bus for the single process ("monolith") runtime.
+
+`MemoryBroker` mimics the small part of the `NatsBroker` API used by the
+briques (`subscriber`, `publisher`, `publish`, `ping`). Messages are python
+objects handed to the handlers as is: no serialization, no network.
+Each delivery runs in its own task, like a NATS subscription would.
+
+NATS subject wildcards are supported (`*` one token, `>` the tail).
+Subscribers sharing a queue name get the messages in turn (queue group).
+"""
+
+import asyncio
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import itertools
+import logging
+from typing import Any, Callable
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MemoryMessage:
+    """Message being handled (stand-in for the faststream message)."""
+
+    body: Any
+    subject: str
+    correlation_id: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+current_message: ContextVar[MemoryMessage | None] = ContextVar(
+    "current_message", default=None
+)
+
+
+def subject_match(pattern: str, subject: str) -> bool:
+    """NATS subject matching (`*` and `>` wildcards)."""
+    if pattern == subject:
+        return True
+    tokens = subject.split(".")
+    parts = pattern.split(".")
+    for i, part in enumerate(parts):
+        if part == ">":
+            return len(tokens) > i
+        if i >= len(tokens) or (part != "*" and part != tokens[i]):
+            return False
+    return len(parts) == len(tokens)
+
+
+class MemoryPublisher:
+    """Publisher bound to a subject."""
+
+    def __init__(self, broker: "MemoryBroker", subject: str):
+        self.broker = broker
+        self.subject = subject
+
+    async def publish(self, message: Any, **kwargs) -> None:
+        await self.broker.publish(message, self.subject, **kwargs)
+
+
+class MemoryBroker:
+    """In-process message broker."""
+
+    def __init__(self) -> None:
+        # subject pattern -> queue -> handlers
+        self._subscribers: dict[str, dict[str, list[Callable]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        self._round_robin: dict[tuple[str, str], Any] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def subscriber(self, subject: str, queue: str = "", **kwargs):
+        """Handler decorator, extra NATS arguments are ignored."""
+
+        def decorator(func: Callable) -> Callable:
+            self._subscribers[subject][queue].append(func)
+            self._round_robin.pop((subject, queue), None)
+            return func
+
+        return decorator
+
+    def publisher(self, subject: str, **kwargs) -> MemoryPublisher:
+        return MemoryPublisher(self, subject)
+
+    def _handlers(self, subject: str) -> list[Callable]:
+        handlers = []
+        for pattern, queues in self._subscribers.items():
+            if not subject_match(pattern, subject):
+                continue
+            for queue, funcs in queues.items():
+                if not queue:
+                    handlers.extend(funcs)
+                    continue
+                key = (pattern, queue)
+                if key not in self._round_robin:
+                    self._round_robin[key] = itertools.cycle(funcs)
+                handlers.append(next(self._round_robin[key]))
+        return handlers
+
+    async def publish(
+        self,
+        message: Any,
+        subject: str,
+        correlation_id: str | None = None,
+        headers: dict[str, str] | None = None,
+        **kwargs,
+    ) -> None:
+        msg = MemoryMessage(
+            body=message,
+            subject=subject,
+            correlation_id=correlation_id or str(uuid.uuid4()),
+            headers=dict(headers or {}),
+        )
+        for handler in self._handlers(subject):
+            task = asyncio.create_task(self._handle(handler, msg))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, handler: Callable, msg: MemoryMessage) -> None:
+        token = current_message.set(msg)
+        try:
+            await handler(msg.body)
+        except Exception:
+            logger.exception(f"error handling message on {msg.subject}")
+        finally:
+            current_message.reset(token)
+
+    async def ping(self, timeout: float | None = None) -> bool:
+        return True
+
+    async def join(self, timeout: float | None = None) -> None:
+        """Wait until every message (and the ones they trigger) is handled."""
+
+        async def _join():
+            while self._tasks:
+                await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+        await asyncio.wait_for(_join(), timeout)
+
+
+# the bus shared by all the briques of the process
+bus = MemoryBroker()
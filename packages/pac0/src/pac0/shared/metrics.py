@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Per hop latency.
+
+Every message published by a service handler carries the timestamps of
+the hop in its headers:
+
+    pac0-hop-service    service that handled the message
+    pac0-hop-enqueued   the handled message was published (queued)
+    pac0-hop-dequeued   the handler started (after the concurrency limit)
+    pac0-hop-published  this message was published
+
+so the next consumer knows, for the service: the queue wait
+(dequeued - enqueued) and the processing time (published - dequeued).
+gestion_cycle_vie aggregates them in `hop_latency` histograms, rendered
+in the Prometheus text format (`GET /metrics`).
+
+Timestamps are wall clock (`time.time()`): hosts must be NTP synced.
+"""
+
+import bisect
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import time
+from typing import Mapping
+
+HOP_SERVICE = "pac0-hop-service"
+HOP_ENQUEUED = "pac0-hop-enqueued"
+HOP_DEQUEUED = "pac0-hop-dequeued"
+HOP_PUBLISHED = "pac0-hop-published"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# histogram buckets (seconds)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# hop being handled: service, enqueued, dequeued
+current_hop: ContextVar[tuple[str, float | None, float] | None] = ContextVar(
+    "current_hop", default=None
+)
+
+
+def _timestamp(headers: Mapping[str, str], name: str) -> float | None:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def start_hop(service: str, headers: Mapping[str, str] | None):
+    """The handler of `service` starts (returns a `current_hop` token)."""
+    enqueued = _timestamp(headers or {}, HOP_PUBLISHED)
+    return current_hop.set((service, enqueued, time.time()))
+
+
+def hop_headers() -> dict[str, str]:
+    """Timestamps headers of a message published now."""
+    headers = {HOP_PUBLISHED: f"{time.time():.6f}"}
+    hop = current_hop.get()
+    if hop is not None:
+        service, enqueued, dequeued = hop
+        headers[HOP_SERVICE] = service
+        headers[HOP_DEQUEUED] = f"{dequeued:.6f}"
+        if enqueued is not None:
+            headers[HOP_ENQUEUED] = f"{enqueued:.6f}"
+    return headers
+
+
+@dataclass
+class Histogram:
+    counts: list[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+    sum: float = 0.0
+    count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HopLatency:
+    """Queue wait and processing time histograms, by service."""
+
+    def __init__(self) -> None:
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+
+    def observe(self, stage: str, kind: str, value: float) -> None:
+        key = (stage, kind)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        # clock skew between hosts
+        self.histograms[key].observe(max(value, 0.0))
+
+    def observe_headers(self, headers: Mapping[str, str] | None) -> None:
+        """Record the hop timestamps of a received message."""
+        if not headers or HOP_SERVICE not in headers:
+            return
+        stage = headers[HOP_SERVICE]
+        enqueued = _timestamp(headers, HOP_ENQUEUED)
+        dequeued = _timestamp(headers, HOP_DEQUEUED)
+        published = _timestamp(headers, HOP_PUBLISHED)
+        if dequeued is None:
+            return
+        if enqueued is not None:
+            self.observe(stage, "queue_wait", dequeued - enqueued)
+        if published is not None:
+            self.observe(stage, "processing", published - dequeued)
+
+    def render(self) -> str:
+        """Prometheus text format."""
+        lines = [
+            "# HELP pac0_hop_seconds Time spent by the messages in each stage.",
+            "# TYPE pac0_hop_seconds histogram",
+        ]
+        for (stage, kind), histogram in sorted(self.histograms.items()):
+            labels = f'stage="{stage}",kind="{kind}"'
+            total = 0
+            for bound, count in zip((*BUCKETS, "+Inf"), histogram.counts):
+                total += count
+                lines.append(f'pac0_hop_seconds_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f"pac0_hop_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"pac0_hop_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# histograms of the process (fed by gestion_cycle_vie)
+hop_latency = HopLatency()
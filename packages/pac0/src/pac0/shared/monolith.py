@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Single process ("monolith") runtime.
+
+Every brique is loaded in the current process and the hops are dispatched
+over the in-memory bus (`pac0.shared.membus`). Enabled by configuration
+only, on the api gateway:
+
+    PAC0_RUNTIME=monolith uv run fastapi run src/pac0/service/api_gateway/main.py
+"""
+
+import importlib
+
+from pac0.shared import esb
+
+# brique modules (except api_gateway, the host of the runtime)
+BRIQUES = (
+    "controle_formats",
+    "validation_metier",
+    "conversion_formats",
+    "annuaire-local",
+    "routage",
+    "transmission_fiscale",
+    "gestion_cycle_vie",
+)
+
+
+def load_briques() -> list[esb.CtxService]:
+    """Import every brique (they register on the in-memory bus)."""
+    for name in BRIQUES:
+        importlib.import_module(f"pac0.service.{name}.main")
+    return esb.services
+
+
+async def startup() -> None:
+    for ctx in esb.services:
+        await ctx.start_load_report()
+
+
+async def shutdown() -> None:
+    """Wait for the messages in flight and flush the batch publishers."""
+    for ctx in esb.services:
+        await ctx.stop_load_report()
+        await ctx.shutdown()
+    await esb.membus.bus.join(timeout=10.0)
+    for ctx in esb.services:
+        await ctx.flush()
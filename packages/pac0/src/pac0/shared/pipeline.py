@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Declarative pipeline of gestion_cycle_vie.
+
+A pipeline is a list of hops (python data or YAML), one pipeline per
+tenant (envelope `tenant` field), `default` for the others:
+
+    pipelines:
+      default:
+        - from: api-gateway
+          to: controle-formats
+        ...
+        - from: annuaire-local
+          switch: recipient_directory   # envelope field
+          cases:
+            remote: routage
+          to: transmission-fiscale      # when no case matches
+      "123456789":
+        - from: api-gateway
+          to: controle-formats
+        - from: controle-formats
+          to: transmission-fiscale      # stages skipped for this tenant
+
+`compile_pipelines()` turns the definitions into a dispatch table
+(tenant -> source stage -> `Route`), resolved with dict lookups only.
+A hop without target (`to: null`) ends the flow.
+
+In choreography mode, the stages of a flow are resolved once, at intake,
+in a routing slip (`Dispatch.slip()`) carried by the envelope.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+import yaml
+
+from pac0.shared.envelope import HEADER_FIELDS, Envelope
+
+DEFAULT_TENANT = "default"
+# pipeline of gestion_cycle_vie (`PAC0_PIPELINE_FILE` to use another one)
+DEFAULT_PIPELINE_FILE = (
+    Path(__file__).parent.parent / "service" / "gestion_cycle_vie" / "pipeline.yaml"
+)
+
+
+class Hop(BaseModel):
+    """One hop of a pipeline definition."""
+
+    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+
+    source: str = Field(alias="from")
+    to: str | None = None
+    switch: str | None = None
+    cases: dict[str, str | None] = {}
+
+    @field_validator("switch")
+    @classmethod
+    def known_field(cls, value: str | None) -> str | None:
+        if value is not None and value not in HEADER_FIELDS:
+            raise ValueError(f"unknown envelope field {value!r}")
+        return value
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    """Compiled hop: next stage, by value of one envelope field."""
+
+    field: str | None
+    cases: dict[str, str | None]
+    default: str | None
+
+    def target(self, envelope: Envelope | None) -> str | None:
+        if self.field is None or envelope is None:
+            return self.default
+        return self.cases.get(getattr(envelope, self.field), self.default)
+
+
+class Dispatch:
+    """Compiled pipelines."""
+
+    def __init__(self, table: dict[str, dict[str, Route]]):
+        if DEFAULT_TENANT not in table:
+            raise ValueError(f"missing {DEFAULT_TENANT!r} pipeline")
+        self.table = table
+        self._default = table[DEFAULT_TENANT]
+
+    @property
+    def sources(self) -> list[str]:
+        """Stages whose output is dispatched (every tenant)."""
+        return sorted({s for routes in self.table.values() for s in routes})
+
+    @property
+    def targets(self) -> list[str]:
+        """Stages messages are dispatched to (every tenant)."""
+        return sorted(
+            {
+                target
+                for routes in self.table.values()
+                for route in routes.values()
+                for target in (route.default, *route.cases.values())
+                if target is not None
+            }
+        )
+
+    @property
+    def stages(self) -> list[str]:
+        """Every stage of the pipelines."""
+        return sorted({*self.sources, *self.targets})
+
+    @property
+    def entries(self) -> list[str]:
+        """Stages starting a flow (never a target)."""
+        return sorted(set(self.sources) - set(self.targets))
+
+    def route(self, source: str, envelope: Envelope | None = None) -> str | None:
+        """Next stage after `source` (None: end of the flow)."""
+        routes = self._default
+        if envelope is not None and envelope.tenant:
+            routes = self.table.get(envelope.tenant, routes)
+        route = routes.get(source)
+        if route is None:
+            return None
+        return route.target(envelope)
+
+    def slip(self, envelope: Envelope | None, start: str) -> list[str]:
+        """Stages after `start`, resolved with the envelope fields."""
+        stages: list[str] = []
+        stage: str | None = start
+        while (stage := self.route(stage, envelope)) is not None:
+            if stage in stages:
+                raise ValueError(f"pipeline loop on {stage!r}")
+            stages.append(stage)
+        return stages
+
+
+def compile_pipelines(definition: dict[str, Any]) -> Dispatch:
+    """Compile `{"pipelines": {tenant: [hop, ...]}}` to a dispatch table."""
+    table: dict[str, dict[str, Route]] = {}
+    for tenant, hops in definition["pipelines"].items():
+        routes: dict[str, Route] = {}
+        for hop in map(Hop.model_validate, hops):
+            if hop.source in routes:
+                raise ValueError(f"{tenant}: duplicate hop from {hop.source!r}")
+            routes[hop.source] = Route(hop.switch, hop.cases, hop.to)
+        table[str(tenant)] = routes
+    return Dispatch(table)
+
+
+def load_pipelines(path: str | Path) -> Dispatch:
+    """Compile the pipelines of a YAML file."""
+    with open(path) as f:
+        return compile_pipelines(yaml.safe_load(f))
+
+
+def settings_pipelines(settings) -> Dispatch:
+    """Compile the pipelines configured by the settings."""
+    return load_pipelines(settings.pipeline_file or DEFAULT_PIPELINE_FILE)
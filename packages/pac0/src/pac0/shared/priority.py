@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Priority lanes: interactive flows vs bulk traffic (e-reporting batches).
+
+Every esb subject has two lanes:
+* `<subject>`: high priority (default, interactive `/flows` deposits)
+* `<subject>-LOW`: low priority (bulk)
+
+The priority is carried in the `pac0-priority` message header (and in the
+`priority` envelope field) and kept from hop to hop.
+
+A service handles both lanes with the same handlers. When the service is
+at `max_inflight`, waiting handlers get the free slots by weighted round
+robin: `weight` high priority handlers for one low priority handler, so
+high priority traffic drains first without starving the low lane.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import StrEnum
+
+PRIORITY_HEADER = "pac0-priority"
+LOW_SUFFIX = "-LOW"
+
+
+class Priority(StrEnum):
+    HIGH = "high"
+    LOW = "low"
+
+
+def parse_priority(value: str | None) -> Priority:
+    """Priority from a header value (high if missing or unknown)."""
+    try:
+        return Priority(value or Priority.HIGH)
+    except ValueError:
+        return Priority.HIGH
+
+
+def lane_subject(subject: str, priority: Priority) -> str:
+    """Subject of the `priority` lane of `subject`."""
+    if priority == Priority.LOW:
+        return subject + LOW_SUFFIX
+    return subject
+
+
+class PriorityLimiter:
+    """
+    Bounded concurrency, waiting handlers served by weighted round robin.
+    """
+
+    def __init__(self, capacity: int, high_weight: int = 4):
+        self.capacity = capacity
+        self.active = 0
+        self._weights = {Priority.HIGH: max(1, high_weight), Priority.LOW: 1}
+        self._credits = dict(self._weights)
+        self._waiters: dict[Priority, deque[asyncio.Future]] = {
+            p: deque() for p in self._weights
+        }
+
+    def waiting(self) -> dict[str, int]:
+        """Handlers waiting for a slot, by priority."""
+        return {str(p): len(q) for p, q in self._waiters.items()}
+
+    def _next(self) -> asyncio.Future | None:
+        ready = [p for p, q in self._waiters.items() if q]
+        if not ready:
+            return None
+        lanes = [p for p in ready if self._credits[p] > 0]
+        if not lanes:
+            # every waiting lane had its turn: new round
+            self._credits = dict(self._weights)
+            lanes = ready
+        priority = lanes[0]
+        self._credits[priority] -= 1
+        return self._waiters[priority].popleft()
+
+    def _wake(self) -> None:
+        while self.active < self.capacity:
+            waiter = self._next()
+            if waiter is None:
+                return
+            self.active += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: Priority = Priority.HIGH) -> None:
+        if self.active < self.capacity and not any(self._waiters.values()):
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted meanwhile: give it back
+                self.release()
+            else:
+                self._waiters[priority].remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.HIGH):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,220 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Retry of the failed messages (`<stage>-ERR`) and dead-letter queue.
+
+A brique reports a failure by publishing the message on `<stage>-ERR`
+with an error code (`pac0-error-code` header, or `error_code` field of a
+dict message, ex: routage `RoutingResult`). gestion_cycle_vie then:
+
+* transient errors (`SMP_TIMEOUT`, `SMP_UNAVAILABLE`, ...): the message is
+  published again on `<stage>-IN` after a jittered exponential backoff
+  ("full jitter": uniform in [0, min(cap, base x 2^attempt)]), at most
+  `retry_max_attempts` times
+* permanent errors, or attempts exhausted: the message goes to the
+  dead-letter subject `esb-dlq.<stage>` (see `pac0.shared.dlq` to replay)
+
+Pending retries are kept in a single `TimerWheel` (one task for all the
+messages, no sleeping task per message) and redelivered at most
+`retry_rate` per second, so an SMP outage does not end in a retry storm.
+"""
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+import logging
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Mapping
+
+logger = logging.getLogger(__name__)
+
+ERROR_CODE_HEADER = "pac0-error-code"
+ERROR_HEADER = "pac0-error"
+ATTEMPT_HEADER = "pac0-attempt"
+
+DLQ_PREFIX = "esb-dlq"
+
+# SMP / network errors worth a retry
+TRANSIENT_ERRORS = frozenset(
+    {"SMP_TIMEOUT", "SMP_UNAVAILABLE", "TIMEOUT", "UNAVAILABLE"}
+)
+
+
+def dlq_subject(stage: str) -> str:
+    return f"{DLQ_PREFIX}.{stage}"
+
+
+def error_code(message: Any, headers: Mapping[str, str] | None) -> str:
+    """Error code of a failed message ("" if unknown)."""
+    if headers and headers.get(ERROR_CODE_HEADER):
+        return headers[ERROR_CODE_HEADER]
+    if isinstance(message, dict):
+        return message.get("error_code") or ""
+    return ""
+
+
+def attempt(headers: Mapping[str, str] | None) -> int:
+    """Retries already done for a message."""
+    try:
+        return int((headers or {}).get(ATTEMPT_HEADER, 0))
+    except ValueError:
+        return 0
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """Full jitter exponential backoff (seconds)."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: `slots` buckets of `tick` seconds, one task.
+
+    Delays longer than a turn of the wheel wait for the next turns
+    (`rounds`). At most `rate` items are fired per second, the others are
+    fired on the next ticks.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Any], Awaitable[None]],
+        tick: float = 0.1,
+        slots: int = 512,
+        rate: float = 0.0,
+    ):
+        self.callback = callback
+        self.tick = tick
+        self.rate = rate
+        self._slots: list[list[list]] = [[] for _ in range(slots)]
+        self._cursor = 0
+        self._ready: deque = deque()
+        self._task: asyncio.Task | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def schedule(self, delay: float, item: Any) -> None:
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks, len(self._slots))
+        slot = (self._cursor + offset) % len(self._slots)
+        # [rounds left, item]
+        self._slots[slot].append([rounds, item])
+        self._size += 1
+
+    def _advance(self) -> None:
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        waiting = []
+        for entry in self._slots[self._cursor]:
+            if entry[0] > 0:
+                entry[0] -= 1
+                waiting.append(entry)
+            else:
+                self._ready.append(entry[1])
+        self._slots[self._cursor] = waiting
+
+    async def _fire(self, budget: int) -> None:
+        while self._ready and budget > 0:
+            item = self._ready.popleft()
+            self._size -= 1
+            budget -= 1
+            try:
+                await self.callback(item)
+            except Exception:
+                logger.exception("retry failed")
+
+    async def run(self) -> None:
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            self._advance()
+            budget = math.ceil(self.rate * self.tick) if self.rate else len(self._ready)
+            await self._fire(budget)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self, flush: bool = True) -> None:
+        """Stop the wheel, firing every pending item now if `flush`."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if flush:
+            for slot in self._slots:
+                self._ready.extend(item for _, item in slot)
+                slot.clear()
+            await self._fire(len(self._ready))
+
+
+@dataclass
+class Retry:
+    """A message waiting for its retry."""
+
+    stage: str
+    message: Any
+    headers: dict[str, str]
+    correlation_id: str | None
+
+
+class RetryScheduler:
+    """Retry or dead-letter the failed messages of the pipeline."""
+
+    def __init__(
+        self,
+        redeliver: Callable[[Retry], Awaitable[None]],
+        dead_letter: Callable[[Retry], Awaitable[None]],
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        rate: float = 50.0,
+        tick: float = 0.1,
+        transient: frozenset[str] = TRANSIENT_ERRORS,
+    ):
+        self.redeliver = redeliver
+        self.dead_letter = dead_letter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.transient = transient
+        self.wheel = TimerWheel(redeliver, tick=tick, rate=rate)
+
+    @classmethod
+    def from_settings(cls, settings, redeliver, dead_letter) -> "RetryScheduler":
+        return cls(
+            redeliver,
+            dead_letter,
+            max_attempts=settings.retry_max_attempts,
+            base_delay=settings.retry_base_delay,
+            max_delay=settings.retry_max_delay,
+            rate=settings.retry_rate,
+            transient=frozenset(settings.retry_transient_errors),
+        )
+
+    async def failed(
+        self,
+        stage: str,
+        message: Any,
+        headers: Mapping[str, str] | None,
+        correlation_id: str | None = None,
+    ) -> bool:
+        """Handle a failed message, True if a retry is scheduled."""
+        code = error_code(message, headers)
+        done = attempt(headers)
+        retry = Retry(stage, message, dict(headers or {}), correlation_id)
+        if code in self.transient and done < self.max_attempts:
+            self.wheel.start()
+            retry.headers[ATTEMPT_HEADER] = str(done + 1)
+            self.wheel.schedule(backoff(done, self.base_delay, self.max_delay), retry)
+            return True
+        await self.dead_letter(retry)
+        return False
+
+    async def stop(self) -> None:
+        """Stop, the pending retries are redelivered now (nothing lost)."""
+        await self.wheel.stop(flush=True)
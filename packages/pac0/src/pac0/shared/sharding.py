@@ -0,0 +1,168 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""
+Per SIREN ordered processing (`PAC0_SHARDS`).
+
+The `<stage>-IN` subjects are split in shards (`<stage>-IN.<shard>`).
+The shard of a message is a consistent hash (jump hash) of its key: the
+supplier SIREN of the envelope (else the recipient SIREN, the invoice id,
+the correlation id). Every message of a key goes to the same shard.
+
+Each shard is handled by one replica of the brique, one message at a
+time: messages of a key are handled in order, without a global lock, and
+the replicas share the shards.
+
+The replicas of a brique announce themselves on `<stage>-SHARDS` (every
+`shard_heartbeat` seconds). Shards are assigned by rendezvous hashing on
+the live replicas: when a replica joins or leaves, only its shards move.
+
+Every publisher and brique must use the same number of shards.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Iterable
+import uuid
+
+from pac0.shared.envelope import decode, is_envelope
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: str) -> int:
+    digest = hashlib.blake2b(value.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach)."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (1 << 31) / ((key >> 33) + 1))
+    return b
+
+
+def shard_of(key: str, shards: int) -> int:
+    return jump_hash(_hash(key), shards)
+
+
+def shard_subject(subject: str, shard: int) -> str:
+    return f"{subject}.{shard}"
+
+
+def shard_key(message: Any, correlation_id: str | None = None) -> str:
+    """Ordering key of a message."""
+    if is_envelope(message):
+        envelope = decode(message)
+        key = envelope.sender_siren or envelope.recipient_siren or envelope.invoice_id
+        if key:
+            return key
+    return correlation_id or ""
+
+
+def owners(replicas: Iterable[str], shards: int) -> dict[int, str]:
+    """Replica of every shard (rendezvous hashing)."""
+    replicas = list(replicas)
+    if not replicas:
+        return {}
+    return {
+        shard: max(replicas, key=lambda r: _hash(f"{r}/{shard}"))
+        for shard in range(shards)
+    }
+
+
+def replica_id() -> str:
+    """Unique id of this process."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class ShardedPublisher:
+    """Publisher on the shards of a subject."""
+
+    def __init__(self, subject: str, publishers: list[Any]):
+        self.subject = subject
+        self.publishers = publishers
+
+    async def publish(self, message: Any, key: str | None = None, **kwargs) -> Any:
+        """Publish on the shard of `key` (default: `shard_key(message)`)."""
+        key = key or shard_key(message, kwargs.get("correlation_id"))
+        shard = shard_of(key, len(self.publishers))
+        return await self.publishers[shard].publish(message, **kwargs)
+
+
+@dataclass
+class ShardManager:
+    """Shards owned by this replica, from the replicas heartbeats."""
+
+    shards: int
+    subscribe: Callable[[int], Awaitable[None]]
+    unsubscribe: Callable[[int], Awaitable[None]]
+    replica: str = field(default_factory=replica_id)
+    ttl: float = 15.0
+    # replica -> last heartbeat (monotonic)
+    members: dict[str, float] = field(default_factory=dict)
+    owned: set[int] = field(default_factory=set)
+
+    def __post_init__(self):
+        self._lock = asyncio.Lock()
+
+    def heartbeat(self) -> dict[str, Any]:
+        return {"replica": self.replica, "leaving": False}
+
+    async def update(self, report: dict[str, Any]) -> None:
+        """A replica heartbeat (or goodbye) was received."""
+        replica = report["replica"]
+        known = replica in self.members
+        if report.get("leaving"):
+            self.members.pop(replica, None)
+        else:
+            self.members[replica] = time.monotonic()
+        if known != (replica in self.members):
+            await self.rebalance()
+
+    async def expire(self) -> None:
+        """Forget the replicas without heartbeat."""
+        now = time.monotonic()
+        dead = [
+            r
+            for r, at in self.members.items()
+            if now - at > self.ttl and r != self.replica
+        ]
+        for replica in dead:
+            logger.info(f"replica {replica} lost")
+            del self.members[replica]
+        if dead:
+            await self.rebalance()
+
+    async def rebalance(self) -> None:
+        async with self._lock:
+            replicas = {*self.members, self.replica}
+            target = {
+                shard
+                for shard, owner in owners(sorted(replicas), self.shards).items()
+                if owner == self.replica
+            }
+            # take the new shards first: a shard is never left unhandled
+            for shard in sorted(target - self.owned):
+                await self.subscribe(shard)
+                self.owned.add(shard)
+            for shard in sorted(self.owned - target):
+                await self.unsubscribe(shard)
+                self.owned.discard(shard)
+            logger.debug(f"{self.replica}: shards {sorted(self.owned)}")
+
+    async def release(self) -> None:
+        """Stop handling every shard."""
+        async with self._lock:
+            for shard in sorted(self.owned):
+                await self.unsubscribe(shard)
+            self.owned.clear()
@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pac0.service.api_gateway.lib.api import router
+from pac0.service.api_gateway.lib.common import load_monitor
+from pac0.shared.backpressure import LoadMonitor
+
+
+def load(service, queued, max_inflight=10):
+    return {"service": service, "queued": queued, "max_inflight": max_inflight}
+
+
+async def test_load_monitor_hysteresis():
+    monitor = LoadMonitor(high=1.0, low=0.5)
+    monitor.update(load("routage", 5))
+    assert not monitor.is_saturated("routage")
+    monitor.update(load("routage", 10))
+    assert monitor.is_saturated("routage")
+    # still saturated above the low watermark
+    monitor.update(load("routage", 7))
+    assert monitor.saturated() == ["routage"]
+    monitor.update(load("routage", 5))
+    assert not monitor.is_saturated("routage")
+    # unbounded service is never saturated
+    monitor.update(load("routage", 1000, max_inflight=0))
+    assert not monitor.is_saturated("routage")
+
+
+async def test_load_monitor_wait_ready():
+    monitor = LoadMonitor()
+    monitor.update(load("routage", 10))
+    assert not await monitor.wait_ready("routage", timeout=0.01)
+
+    waiter = asyncio.create_task(monitor.wait_ready("routage", timeout=1.0))
+    await asyncio.sleep(0)
+    monitor.update(load("routage", 0))
+    assert await waiter
+
+    # stale reports are ignored
+    monitor = LoadMonitor(stale_after=0.0)
+    monitor.update(load("routage", 10))
+    assert await monitor.wait_ready("routage")
+
+
+def test_flows_intake_backpressure():
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as client:
+        load_monitor.update(load("routage", 10))
+        response = client.post("/flows")
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+        load_monitor.update(load("routage", 0))
+        response = client.post("/flows")
+        assert response.status_code == 200
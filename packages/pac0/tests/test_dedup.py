@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from faststream.nats import TestNatsBroker
+
+from pac0.shared.dedup import (
+    MESSAGE_ID_HEADER,
+    BloomFilter,
+    Deduplicator,
+    LRUCache,
+    WindowedBloomFilter,
+)
+from pac0.shared.esb import SettingsService, init_esb_app
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.add("a")
+    cache.add("b")
+    assert "a" in cache
+    cache.add("c")
+    # "b" is the least recently used
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert len(cache) == 2
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, 1e-4)
+    for i in range(1000):
+        bloom.add(f"m{i}")
+    assert all(f"m{i}" in bloom for i in range(1000))
+    false_positives = sum(f"x{i}" in bloom for i in range(10000))
+    assert false_positives < 10
+
+
+def test_windowed_bloom_filter():
+    bloom = WindowedBloomFilter(100, 1e-4, window=60)
+    bloom.add("a")
+    # next window: still known
+    bloom._rotated_at -= 60
+    assert "a" in bloom
+    # two windows later: forgotten
+    bloom._rotated_at -= 60
+    bloom.add("b")
+    bloom._rotated_at -= 60
+    assert "a" not in bloom
+    assert "b" in bloom
+
+
+async def test_deduplicator():
+    dedup = Deduplicator(cache_size=1, capacity=100)
+    assert not await dedup.drop("s:1")
+    await dedup.add("s:1")
+    await dedup.add("s:2")
+    # evicted from the LRU, still in the Bloom filter
+    assert await dedup.drop("s:1")
+    assert not await dedup.drop(None)
+    assert dedup.dropped == 1
+
+
+async def test_esb_dedup():
+    """a redelivered message is handled once"""
+    ctx, broker, app = init_esb_app("test-dedup", SettingsService())
+    handled = []
+
+    @ctx.subscriber()
+    async def process(message: str):
+        handled.append(message)
+
+    async with TestNatsBroker(broker) as br:
+        headers = {MESSAGE_ID_HEADER: "m1"}
+        await br.publish("hello", ctx.subject_in, headers=headers)
+        await br.publish("hello", ctx.subject_in, headers=headers)
+        await br.publish("hello", ctx.subject_in)
+        assert handled == ["hello", "hello"]
+        assert ctx.stats()["duplicates"] == 1
@@ -0,0 +1,131 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import struct
+
+import pytest
+
+from pac0.shared.blobstore import (
+    BlobNotFoundError,
+    LocalBlobStore,
+    blob_key,
+    check_in,
+    check_out,
+)
+from pac0.shared.compression import CompressionError, Compressor
+from pac0.shared.envelope import (
+    FLAG_CLAIM_CHECK,
+    MAGIC,
+    VERSION,
+    Envelope,
+    EnvelopeError,
+    decode,
+    encode,
+    is_envelope,
+)
+from pac0.shared.esb import SettingsService, init_esb_app
+
+
+def test_envelope_roundtrip():
+    payload = b"<Invoice>\xc3\xa9</Invoice>" * 1000
+    envelope = Envelope(
+        invoice_id="F202500003",
+        sender_siren="123456789",
+        recipient_siren="987654321",
+        recipient_siret="98765432100012",
+        document_type="invoice_ubl",
+        status="received",
+        payload=payload,
+    )
+    data = encode(envelope)
+    assert is_envelope(data)
+
+    decoded = decode(data)
+    assert decoded.invoice_id == "F202500003"
+    assert decoded.recipient_siret == "98765432100012"
+    assert decoded.sender_siret == ""
+    assert isinstance(decoded.payload, memoryview)
+    assert decoded.payload == payload
+
+    # header update, payload passed through
+    routed = decode(encode(decoded.replace(status="routed")))
+    assert routed.status == "routed"
+    assert routed.payload == payload
+
+
+def test_envelope_unknown_fields():
+    """fields added by a newer producer are skipped"""
+    fields = [b"F1", b"", b"", b"", b"", b"", b"ok", b"new-field"]
+    data = b"".join(
+        (
+            struct.pack("!2sBBB", MAGIC, VERSION, 0, len(fields)),
+            struct.pack(f"!{len(fields)}H", *map(len, fields)),
+            *fields,
+            b"payload",
+        )
+    )
+    decoded = decode(data)
+    assert decoded.invoice_id == "F1"
+    assert decoded.status == "ok"
+    assert decoded.payload == b"payload"
+
+
+def test_envelope_invalid():
+    assert not is_envelope("P0 text")
+    with pytest.raises(EnvelopeError):
+        decode(b"XX\x01\x00\x00")
+    with pytest.raises(EnvelopeError):
+        decode(MAGIC + bytes([VERSION + 1, 0, 0]))
+    with pytest.raises(EnvelopeError):
+        decode(encode(Envelope(invoice_id="F1"))[:8])
+
+
+async def test_claim_check(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    payload = b"<Invoice/>" * 100
+    envelope = Envelope(invoice_id="F1", payload=payload)
+
+    # small payload: kept inline
+    assert await check_in(envelope, store, threshold=len(payload)) is envelope
+
+    checked = await check_in(envelope, store, threshold=10)
+    assert checked.flags & FLAG_CLAIM_CHECK
+    assert bytes(checked.payload) == blob_key(payload).encode()
+
+    # the reference crosses the bus, not the payload
+    received = decode(encode(checked))
+    assert received.invoice_id == "F1"
+    assert await check_out(received, store) == payload
+
+    # content addressed: same payload, same key
+    assert await store.put(payload) == blob_key(payload)
+    with pytest.raises(BlobNotFoundError):
+        await store.get(blob_key(b"unknown"))
+    with pytest.raises(BlobNotFoundError):
+        await store.get("sha256:../../etc/passwd")
+
+
+async def test_compression(tmp_path):
+    settings = SettingsService(
+        compression="gzip", claim_check_threshold=100, blob_store_dir=str(tmp_path)
+    )
+    ctx, broker, app = init_esb_app("test-compression", settings)
+    payload = b"<cbc:ID>F1</cbc:ID>" * 1000
+    envelope = Envelope(invoice_id="F1", payload=payload)
+
+    sent = await ctx.check_in(envelope)
+    assert sent.content_encoding == "gzip"
+    assert len(sent.payload) < len(payload)
+
+    # compressed then claim-checked, decompressed only on check_out
+    received = decode(encode(sent))
+    assert received.content_encoding == "gzip"
+    assert await ctx.check_out(received) == payload
+
+    # small payloads are sent as is
+    small = await ctx.check_in(Envelope(payload=b"<Invoice/>"))
+    assert small.content_encoding == ""
+
+    with pytest.raises(CompressionError):
+        Compressor().decompress(b"", "br")
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+
+from faststream.nats import TestNatsBroker
+
+from pac0.shared.esb import (
+    BatchPublisher,
+    NatsPool,
+    SettingsService,
+    durable_name,
+    init_esb_app,
+)
+from pac0.shared.priority import PRIORITY_HEADER, Priority, PriorityLimiter
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, **kwargs):
+        self.published.append(message)
+
+
+async def test_esb_core_mode():
+    """core NATS mode (default): queue group subscriber, no stream"""
+    ctx, broker, app = init_esb_app("test-core", SettingsService())
+    assert ctx.stream is None
+
+    @ctx.subscriber()
+    async def process(message: str):
+        await ctx.publisher_out.publish(message)
+
+    async with TestNatsBroker(broker) as br:
+        await br.publish("hello", ctx.subject_in)
+        process.mock.assert_called_once_with("hello")
+        ctx.publisher_out.mock.assert_called_once_with("hello")
+
+
+async def test_esb_jetstream_mode():
+    """JetStream mode: durable pull consumer on the shared stream"""
+    settings = SettingsService(jetstream=True, jetstream_batch_size=50)
+    ctx, broker, app = init_esb_app("test-js", settings)
+    assert ctx.stream is not None
+    assert ctx.stream.name == settings.jetstream_stream
+
+    @ctx.subscriber()
+    async def process(message: str): ...
+
+    assert durable_name("a.b-IN") == "a_b-IN"
+
+    async with TestNatsBroker(broker) as br:
+        await br.publish("hello", ctx.subject_in, stream=ctx.stream.name)
+        process.mock.assert_called_once_with("hello")
+
+
+async def test_batch_publisher_size():
+    """the buffer is flushed as soon as it is full"""
+    pub = FakePublisher()
+    batch = BatchPublisher(pub, max_size=3, max_delay=60)
+    await batch.publish("a")
+    await batch.publish("b")
+    assert pub.published == []
+    await batch.publish("c")
+    assert pub.published == ["a", "b", "c"]
+    assert len(batch) == 0
+
+
+async def test_batch_publisher_delay():
+    """the buffer is flushed after max_delay"""
+    pub = FakePublisher()
+    batch = BatchPublisher(pub, max_size=100, max_delay=0.01)
+    await batch.publish("a")
+    assert pub.published == []
+    await asyncio.sleep(0.05)
+    assert pub.published == ["a"]
+
+
+async def test_publish_many():
+    ctx, broker, app = init_esb_app("test-many", SettingsService(publish_batch_size=2))
+
+    @ctx.subscriber(ctx.subject_out)
+    async def process(message: str): ...
+
+    async with TestNatsBroker(broker) as br:
+        await ctx.publish_many(["a", "b", "c"])
+        assert process.mock.call_count == 3
+
+        batch = ctx.batch_publisher()
+        await batch.publish("d")
+        await ctx.flush()
+        assert process.mock.call_count == 4
+
+
+def test_settings_service_overrides():
+    settings = SettingsService(
+        workers=2,
+        service_overrides={"routage": {"workers": 32, "prefetch": 500}},
+    )
+    assert settings.for_service("routage").workers == 32
+    assert settings.for_service("routage").prefetch == 500
+    assert settings.for_service("controle-formats") is settings
+
+
+async def test_esb_inflight():
+    """handlers in flight are counted and bounded by max_inflight"""
+    ctx, broker, app = init_esb_app("test-inflight", SettingsService(max_inflight=1))
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    @ctx.subscriber()
+    @ctx.subscriber(ctx.subject_err)
+    async def process(message: str):
+        started.set()
+        await release.wait()
+
+    async with TestNatsBroker(broker) as br:
+        task = asyncio.create_task(br.publish("a", ctx.subject_in))
+        await started.wait()
+        assert ctx.inflight == 1
+        assert ctx.stats()["inflight"] == 1
+        release.set()
+        await task
+        assert ctx.inflight == 0
+
+        await br.publish("b", ctx.subject_err)
+        assert process.mock.call_count == 2
+        assert ctx.inflight == 0
+
+        stats = await br.request(None, f"{ctx.prefix}-STATS")
+        assert (await stats.decode())["service"] == "test-inflight"
+
+
+def test_nats_pool():
+    """co-located services share the pooled connections"""
+    pool = NatsPool()
+    settings = SettingsService(nats_pool_size=2, nats_pending_size=1024)
+    a = pool.broker("a", settings)
+    b = pool.broker("b", settings)
+    c = pool.broker("c", settings)
+    assert a is not b
+    assert c is a
+    assert pool.broker("b", settings) is b
+    assert pool.app(a) is pool.app(c)
+    assert a._connection_kwargs["pending_size"] == 1024
+
+    stats = pool.stats()
+    assert [s["services"] for s in stats] == [["a", "c"], ["b"]]
+    assert not stats[0]["connected"]
+
+    # one connection per service
+    single = SettingsService(nats_pool_size=0)
+    assert pool.broker("d", single) is not pool.broker("e", single)
+
+
+async def test_priority_lanes():
+    """the low priority lane is handled and kept on the next hop"""
+    ctx, broker, app = init_esb_app("test-lanes", SettingsService())
+
+    @ctx.subscriber()
+    async def process(message: str):
+        await ctx.publisher_out.publish(message)
+
+    async with TestNatsBroker(broker) as br:
+        await br.publish(
+            "bulk", f"{ctx.subject_in}-LOW", headers={PRIORITY_HEADER: "low"}
+        )
+        process.mock.assert_called_once_with("bulk")
+        ctx.publisher_out.low.mock.assert_called_once_with("bulk")
+        assert not ctx.publisher_out.high.mock.called
+
+
+async def test_priority_limiter():
+    """high priority drains first, low priority is not starved"""
+    limiter = PriorityLimiter(1, high_weight=2)
+    await limiter.acquire()
+    order = []
+
+    async def handle(priority, name):
+        async with limiter.slot(priority):
+            order.append(name)
+
+    tasks = [asyncio.create_task(handle(Priority.LOW, f"l{i}")) for i in range(2)]
+    tasks += [asyncio.create_task(handle(Priority.HIGH, f"h{i}")) for i in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.waiting() == {"high": 3, "low": 2}
+
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["h0", "h1", "l0", "h2", "l1"]
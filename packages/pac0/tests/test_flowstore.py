@@ -0,0 +1,34 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from pac0.shared.flowstore import DONE, FlowEvent, LocalFlowStore
+
+
+async def test_local_flow_store(tmp_path):
+    log = tmp_path / "flows.jsonl"
+    store = LocalFlowStore(log)
+    await store.append(FlowEvent(flow_id="f1", stage="controle-formats", at=1.0))
+    await store.append(
+        FlowEvent(
+            flow_id="f1",
+            stage="transmission-fiscale",
+            status=DONE,
+            tracking_id="t1",
+            sirens=["123456789"],
+            at=3.0,
+        )
+    )
+    # late event: counted, the current state does not go back
+    await store.append(FlowEvent(flow_id="f1", stage="routage", at=2.0))
+
+    state = await store.get("f1")
+    assert (state.stage, state.status) == ("transmission-fiscale", DONE)
+    assert state.events == 3
+    assert (await store.by_tracking_id("t1")) == state
+    assert (await store.by_siren("123456789")) == [state]
+    assert len(await store.history("f1")) == 3
+    assert await store.get("unknown") is None
+
+    # the event log is replayed at startup
+    assert await LocalFlowStore(log).get("f1") == state
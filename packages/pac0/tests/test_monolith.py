@@ -0,0 +1,212 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import importlib
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from pac0.shared import esb
+from pac0.shared.envelope import Envelope, decode, encode
+from pac0.shared.esb import LIFECYCLE_SUBJECT
+from pac0.shared.flowstore import FlowEvent
+from pac0.shared.metrics import hop_latency
+from pac0.shared.membus import MemoryBroker, bus, current_message, subject_match
+
+
+def test_subject_match():
+    assert subject_match("a.b", "a.b")
+    assert subject_match("*", "routage-IN")
+    assert not subject_match("*", "a.b")
+    assert subject_match("a.*", "a.b")
+    assert subject_match("a.>", "a.b.c")
+    assert not subject_match("a.>", "a")
+
+
+async def test_memory_broker_queue_group():
+    broker = MemoryBroker()
+    received = []
+
+    @broker.subscriber("s", "q")
+    async def h1(message):
+        received.append(("h1", message))
+
+    @broker.subscriber("s", "q")
+    async def h2(message):
+        received.append(("h2", message))
+
+    await broker.publish({"a": 1}, "s")
+    await broker.publish({"a": 2}, "s")
+    await broker.join(timeout=1.0)
+    assert sorted(received, key=str) == [("h1", {"a": 1}), ("h2", {"a": 2})]
+
+
+def reset_monolith():
+    # briques register on the shared bus at import time
+    for name in list(sys.modules):
+        if name.startswith("pac0.service."):
+            del sys.modules[name]
+    bus._subscribers.clear()
+    bus._round_robin.clear()
+    esb.services.clear()
+    esb._local_flow_store = None
+
+
+@pytest.fixture
+def monolith(monkeypatch):
+    monkeypatch.setenv("PAC0_RUNTIME", "monolith")
+    reset_monolith()
+    yield
+    reset_monolith()
+
+
+async def test_monolith_pipeline(monolith):
+    """an invoice crosses every brique over the in-memory bus"""
+    from pac0.shared.monolith import BRIQUES, load_briques
+
+    services = load_briques()
+    assert len(services) == len(BRIQUES)
+
+    payload = object()  # not serializable: passed by reference
+    received = []
+
+    @bus.subscriber("transmission-fiscale-OUT")
+    async def out(message):
+        received.append(message)
+
+    await bus.publish(payload, "api-gateway-OUT", correlation_id="cid")
+    await bus.join(timeout=1.0)
+    assert received == [payload]
+
+    # lifecycle recorded by gestion_cycle_vie
+    store = esb.get_flow_store(esb.SettingsService(runtime="monolith"), bus)
+    state = await store.get("cid")
+    assert (state.stage, state.status) == ("transmission-fiscale", "done")
+
+    # hop timestamps aggregated by gestion_cycle_vie
+    for kind in ("queue_wait", "processing"):
+        assert hop_latency.histograms[("controle-formats", kind)].count >= 1
+
+
+def test_monolith_api_gateway(monolith):
+    main = importlib.import_module("pac0.service.api_gateway.main")
+    with TestClient(main.app) as client:
+        response = client.get("/healthcheck")
+        assert response.status_code == 200
+
+        response = client.get("/metrics")
+        assert response.text.startswith("# HELP pac0_hop_seconds")
+
+        store = main.app.state.flow_store
+        event = FlowEvent(
+            flow_id="f1", stage="routage", tracking_id="t1", sirens=["123"]
+        )
+        client.portal.call(store.append, event)
+        assert client.get("/flows/f1").json()["stage"] == "routage"
+        assert client.get("/flows/f2").status_code == 404
+        flows = client.get("/flows", params={"trackingId": "t1"}).json()
+        assert [f["flow_id"] for f in flows] == ["f1"]
+        flows = client.get("/flows", params={"siren": "123"}).json()
+        assert [f["flow_id"] for f in flows] == ["f1"]
+
+
+async def test_monolith_choreography(monolith, monkeypatch):
+    """briques hop directly to the next stage, from the routing slip"""
+    monkeypatch.setenv("PAC0_CHOREOGRAPHY", "1")
+    from pac0.shared.monolith import load_briques
+
+    load_briques()
+    received, outs, events = [], [], []
+
+    @bus.subscriber("transmission-fiscale-OUT")
+    async def out(message):
+        received.append(decode(message))
+
+    @bus.subscriber("controle-formats-OUT")
+    async def out_03(message):
+        outs.append(message)
+
+    @bus.subscriber(LIFECYCLE_SUBJECT)
+    async def lifecycle(event):
+        events.append(event)
+
+    message = encode(Envelope(invoice_id="F1", payload=b"<Invoice/>"))
+    await bus.publish(message, "api-gateway-OUT", correlation_id="cid")
+    await bus.join(timeout=1.0)
+    for ctx in esb.services:
+        await ctx.flush()
+    await bus.join(timeout=1.0)
+
+    assert [e.invoice_id for e in received] == ["F1"]
+    assert received[0].routing_slip == ""
+    assert outs == []
+    assert [(e["stage"], e["next"]) for e in events] == [
+        ("controle-formats", "validation-metier"),
+        ("validation-metier", "conversion-formats"),
+        ("conversion-formats", "annuaire-local"),
+        ("annuaire-local", "transmission-fiscale"),
+    ]
+
+
+async def test_monolith_retry(monolith, monkeypatch):
+    """transient errors go back to `<stage>-IN`, the others to the DLQ"""
+    monkeypatch.setenv("PAC0_RETRY_BASE_DELAY", "0.01")
+    from pac0.shared.monolith import load_briques
+    from pac0.shared.retry import ATTEMPT_HEADER, ERROR_CODE_HEADER
+
+    load_briques()
+    retried, dead = [], []
+
+    @bus.subscriber("routage-IN")
+    async def routage_in(message):
+        retried.append(current_message.get().headers[ATTEMPT_HEADER])
+
+    @bus.subscriber("esb-dlq.routage")
+    async def dlq(message):
+        dead.append(current_message.get().headers[ERROR_CODE_HEADER])
+
+    await bus.publish(
+        b"m1", "routage-ERR", headers={ERROR_CODE_HEADER: "SMP_TIMEOUT"}
+    )
+    await bus.publish(
+        b"m2",
+        "routage-ERR",
+        correlation_id="cid",
+        headers={ERROR_CODE_HEADER: "PARTICIPANT_NOT_FOUND"},
+    )
+    await bus.join(timeout=1.0)
+    await asyncio.sleep(0.3)
+    await bus.join(timeout=1.0)
+
+    assert retried == ["1"]
+    assert dead == ["PARTICIPANT_NOT_FOUND"]
+    store = esb.get_flow_store(esb.SettingsService(runtime="monolith"), bus)
+    assert (await store.get("cid")).status == "error"
+    for ctx in esb.services:
+        await ctx.shutdown()
+
+
+async def test_monolith_shards(monolith, monkeypatch):
+    """messages of a SIREN go to one shard, handled in order"""
+    monkeypatch.setenv("PAC0_SHARDS", "4")
+    from pac0.shared.esb import init_esb_app
+
+    ctx, _, _ = init_esb_app("test-shards")
+    handled = []
+
+    @ctx.subscriber()
+    async def process(message):
+        envelope = decode(message)
+        # the first message is the slowest
+        await asyncio.sleep(0.01 if envelope.invoice_id == "F0" else 0)
+        handled.append(envelope.invoice_id)
+
+    publisher = ctx.publisher(ctx.subject_in)
+    for i in range(5):
+        message = encode(Envelope(invoice_id=f"F{i}", sender_siren="123456789"))
+        await publisher.publish(message)
+    await bus.join(timeout=1.0)
+    assert handled == [f"F{i}" for i in range(5)]
@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from pathlib import Path
+
+from pydantic import ValidationError
+import pytest
+
+import pac0
+from pac0.shared.envelope import Envelope
+from pac0.shared.pipeline import compile_pipelines, load_pipelines
+
+PIPELINE_YAML = (
+    Path(pac0.__file__).parent / "service" / "gestion_cycle_vie" / "pipeline.yaml"
+)
+
+
+def test_default_pipeline():
+    dispatch = load_pipelines(PIPELINE_YAML)
+    assert dispatch.route("api-gateway") == "controle-formats"
+    assert dispatch.route("routage") == "transmission-fiscale"
+    assert dispatch.route("transmission-fiscale") is None
+
+    # conditional branch on the local directory membership
+    remote = Envelope(recipient_directory="remote")
+    assert dispatch.route("annuaire-local", remote) == "routage"
+    local = Envelope(recipient_directory="local")
+    assert dispatch.route("annuaire-local", local) == "transmission-fiscale"
+    assert dispatch.route("annuaire-local") == "transmission-fiscale"
+
+
+def test_tenant_pipeline():
+    dispatch = compile_pipelines(
+        {
+            "pipelines": {
+                "default": [{"from": "api-gateway", "to": "controle-formats"}],
+                "123456789": [
+                    {"from": "api-gateway", "to": "transmission-fiscale"},
+                ],
+            }
+        }
+    )
+    assert dispatch.route("api-gateway", Envelope(tenant="123456789")) == (
+        "transmission-fiscale"
+    )
+    assert dispatch.route("api-gateway", Envelope(tenant="x")) == "controle-formats"
+    assert dispatch.sources == ["api-gateway"]
+    assert dispatch.targets == ["controle-formats", "transmission-fiscale"]
+
+
+def test_invalid_pipeline():
+    with pytest.raises(ValidationError):
+        compile_pipelines(
+            {"pipelines": {"default": [{"from": "a", "switch": "unknown"}]}}
+        )
+    with pytest.raises(ValueError, match="duplicate"):
+        compile_pipelines(
+            {"pipelines": {"default": [{"from": "a"}, {"from": "a"}]}}
+        )
+    with pytest.raises(ValueError, match="default"):
+        compile_pipelines({"pipelines": {"x": []}})
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+
+from pac0.shared.retry import (
+    ATTEMPT_HEADER,
+    ERROR_CODE_HEADER,
+    RetryScheduler,
+    TimerWheel,
+    backoff,
+)
+
+
+async def test_timer_wheel():
+    fired = []
+
+    async def callback(item):
+        fired.append(item)
+
+    wheel = TimerWheel(callback, tick=0.01, slots=4)
+    wheel.schedule(0.02, "a")
+    # more than a turn of the wheel
+    wheel.schedule(0.1, "b")
+    assert len(wheel) == 2
+    wheel.start()
+    await asyncio.sleep(0.05)
+    assert fired == ["a"]
+    await asyncio.sleep(0.1)
+    assert fired == ["a", "b"]
+    assert len(wheel) == 0
+    await wheel.stop()
+
+
+async def test_timer_wheel_stop_flush():
+    fired = []
+
+    async def callback(item):
+        fired.append(item)
+
+    wheel = TimerWheel(callback, tick=10)
+    wheel.schedule(60, "a")
+    await wheel.stop(flush=True)
+    assert fired == ["a"]
+
+
+def test_backoff():
+    for attempt in range(10):
+        assert 0 <= backoff(attempt, 1.0, 30.0) <= min(30.0, 2**attempt)
+
+
+async def test_retry_scheduler():
+    redelivered, dead = [], []
+
+    async def redeliver(retry):
+        redelivered.append(retry)
+
+    async def dead_letter(retry):
+        dead.append(retry)
+
+    retries = RetryScheduler(
+        redeliver, dead_letter, max_attempts=2, base_delay=0.01, tick=0.01
+    )
+    timeout = {ERROR_CODE_HEADER: "SMP_TIMEOUT"}
+
+    # transient: retried with the attempt counter
+    assert await retries.failed("routage", "m1", timeout, "c1")
+    await asyncio.sleep(0.05)
+    assert [(r.message, r.headers[ATTEMPT_HEADER]) for r in redelivered] == [
+        ("m1", "1")
+    ]
+
+    # attempts exhausted
+    assert not await retries.failed("routage", "m1", {**timeout, ATTEMPT_HEADER: "2"})
+    # permanent, error code of a dict message (routage `RoutingResult`)
+    assert not await retries.failed("routage", {"error_code": "PARTICIPANT_NOT_FOUND"}, {})
+    assert [r.stage for r in dead] == ["routage", "routage"]
+    await retries.stop()
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: 2026 Philippe ENTZMANN <philippe@entzmann.name>
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from pac0.shared.envelope import Envelope, encode
+from pac0.shared.sharding import ShardManager, owners, shard_key, shard_of
+
+
+def test_shard_of():
+    keys = [f"{i:09d}" for i in range(1000)]
+    before = {key: shard_of(key, 8) for key in keys}
+    assert set(before.values()) == set(range(8))
+    # one more shard: only the keys of the new shard move
+    after = {key: shard_of(key, 9) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == 8 for key in moved)
+    assert len(moved) < 200
+
+
+def test_shard_key():
+    message = encode(Envelope(invoice_id="F1", recipient_siren="987654321"))
+    assert shard_key(message) == "987654321"
+    assert shard_key({"a": 1}, "cid") == "cid"
+
+
+def test_owners():
+    shards = owners(["r1", "r2"], 16)
+    assert set(shards.values()) == {"r1", "r2"}
+    # r3 joins: shards only move to r3
+    moved = {s: o for s, o in owners(["r1", "r2", "r3"], 16).items() if o != shards[s]}
+    assert set(moved.values()) == {"r3"}
+
+
+async def test_shard_manager():
+    handled = set()
+
+    async def subscribe(shard):
+        handled.add(shard)
+
+    async def unsubscribe(shard):
+        handled.discard(shard)
+
+    manager = ShardManager(8, subscribe, unsubscribe, replica="r1", ttl=0)
+    await manager.rebalance()
+    assert handled == set(range(8))
+    await manager.update({"replica": "r2"})
+    assert handled == {s for s, o in owners(["r1", "r2"], 8).items() if o == "r1"}
+    # r2 stopped sending heartbeats
+    await manager.expire()
+    assert handled == set(range(8))
+    await manager.release()
+    assert handled == set()